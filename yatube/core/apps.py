@@ -3,3 +3,23 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import (post_delete, post_migrate,
+                                              post_save)
+
+        from .auth import invalidate_user
+        from .db import check_connections, configure_sqlite, reapply_pragmas
+        from .slow_queries import install
+
+        connection_created.connect(configure_sqlite)
+        connection_created.connect(install)
+        post_migrate.connect(reapply_pragmas)
+        # После close_old_connections Django, который подключен раньше.
+        request_started.connect(check_connections)
+        # Смена пароля и сброс пароля сохраняют пользователя через save().
+        post_save.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
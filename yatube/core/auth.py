@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend, UserModel
+from django.core.cache import cache
+
+SESSION_HASH = 'session_auth_hash'
+
+
+def user_key(user_id):
+    return f'session_user:{user_id}'
+
+
+def cached_fields(user):
+    """Поля пользователя для кеша: все, кроме хеша пароля."""
+    data = {
+        field.attname: getattr(user, field.attname)
+        for field in UserModel._meta.concrete_fields
+        if field.attname != 'password'
+    }
+    data[SESSION_HASH] = user.get_session_auth_hash()
+    return data
+
+
+def cached_user(data):
+    """Пользователь из cached_fields() с отложенным полем password.
+
+    Пароль читается из базы только при проверке или смене пароля; до
+    этого сессия сверяется с кешированным HMAC от хеша пароля.
+    """
+    data = dict(data)
+    session_hash = data.pop(SESSION_HASH)
+    user = UserModel.from_db('default', list(data), list(data.values()))
+    get_session_auth_hash = user.get_session_auth_hash
+
+    def get_hash():
+        if 'password' in user.get_deferred_fields():
+            return session_hash
+        return get_session_auth_hash()
+
+    user.get_session_auth_hash = get_hash
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который берет пользователя сессии из кеша.
+
+    AuthenticationMiddleware зовет get_user() на каждый запрос вошедшего
+    пользователя. В кеше лежат поля без хеша пароля (cached_fields), запись
+    пользователя сбрасывает их через invalidate_user (post_save и
+    post_delete User); QuerySet.update() кеш не сбрасывает.
+    """
+
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        data = cache.get(key)
+        if data is None:
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, cached_fields(user), settings.USER_CACHE_TIMEOUT)
+        else:
+            user = cached_user(data)
+        return user if self.user_can_authenticate(user) else None
+
+
+def invalidate_user(sender, instance, **kwargs):
+    cache.delete(user_key(instance.pk))
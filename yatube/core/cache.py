@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Model
+
+from . import routers
+from .tiered_cache import TIERS, tier_stats_key
+
+logger = logging.getLogger(__name__)
+
+_revalidate_executor = None
+_revalidate_lock = threading.Lock()
+
+# Как часто счетчики record_lookup() переносятся в общий кеш, секунды.
+STATS_FLUSH_INTERVAL = 5
+
+_lookups = Counter()
+_lookups_lock = threading.Lock()
+_lookups_flushed = time.monotonic()
+
+
+def scope_for(obj):
+    """Имя области инвалидации: строка как есть, модель - 'app.model:pk'."""
+    if isinstance(obj, Model):
+        return model_scope(type(obj), obj.pk)
+    return str(obj)
+
+
+def model_scope(model, pk):
+    return f'{model._meta.label_lower}:{pk}'
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def get_generations(scopes):
+    """Текущие поколения областей; отсутствующие заводятся заново.
+
+    Новое поколение начинается с текущего времени в миллисекундах, чтобы
+    после вытеснения счетчика не совпасть со старыми ключами. Если реплики
+    могут еще не видеть недавнюю запись, поток читает из default: под
+    этими поколениями будут кешироваться данные.
+    """
+    keys = [_generation_key(scope) for scope in scopes]
+    replicas = bool(settings.DATABASE_REPLICAS)
+    found = cache.get_many(
+        keys + [routers.RECENT_WRITE_KEY] if replicas else keys
+    )
+    if found.pop(routers.RECENT_WRITE_KEY, None) is not None:
+        routers.pin()
+    generations = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key)
+        generations.append(found[key])
+    return generations
+
+
+def bump_generation(*scopes):
+    """Сдвигает поколения областей.
+
+    Кеш с incr_many (SQLiteCache, TieredCache) сдвигает все области одной
+    транзакцией: fan_out() бампает ленты тысяч подписчиков.
+    """
+    if settings.DATABASE_REPLICAS:
+        routers.mark_recent_write()
+    keys = [_generation_key(scope) for scope in dict.fromkeys(scopes)]
+    if hasattr(cache, 'incr_many'):
+        cache.incr_many(keys, initial=int(time.time() * 1000))
+        return
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
+
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _lock_key(key):
+    return f'lock:{key}'
+
+
+def get_or_build(key, build, timeout=None, stale_key=None):
+    """Значение из кеша, а при промахе - build(), который считает один вызов.
+
+    Промахнувшийся вызов берет короткую блокировку в том же кеше
+    (cache.add атомарен и между процессами) и пересчитывает значение.
+    Остальные сразу получают устаревшую копию из stale_key, а без нее
+    ждут до CACHE_LOCK_WAIT секунд и только потом считают сами.
+    Возвращает пару (значение, было ли попадание).
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value, True
+    lock_key = _lock_key(key)
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, settings.CACHE_LOCK_TIMEOUT):
+        if stale_key is not None:
+            value = cache.get(stale_key)
+            if value is not None:
+                return value, False
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value, False
+    try:
+        value = build()
+        cache.set(key, value, timeout)
+        if stale_key is not None:
+            # Устаревшая копия живет дольше свежей, чтобы было что отдать.
+            cache.set(stale_key, value, timeout and timeout * 2)
+    finally:
+        _release(lock_key, token)
+    return value, False
+
+
+def _release(lock_key, token):
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def get_or_revalidate(key, build, timeout, stale_timeout, stale_key=None,
+                      detach=None):
+    """get_or_build() в режиме stale-while-revalidate.
+
+    Запись свежая timeout секунд и хранится еще stale_timeout. В этом
+    промежутке вызов сразу отдает старое значение, а build() выполняется
+    в фоновом пуле потоков. Если build() держит объекты запроса, detach()
+    в потоке вызова возвращает независимую от них замену для пула.
+    Возвращает (значение, было ли попадание).
+    """
+    entry, hit = get_or_build(
+        key, lambda: (build(), time.time() + timeout),
+        timeout + stale_timeout, stale_key=stale_key,
+    )
+    value, fresh_until = entry
+    if hit and fresh_until <= time.time():
+        revalidate(key, build, timeout, stale_timeout, detach)
+    return value, hit
+
+
+def get_revalidate_executor():
+    global _revalidate_executor
+    with _revalidate_lock:
+        if _revalidate_executor is None:
+            _revalidate_executor = ThreadPoolExecutor(
+                max_workers=settings.CACHE_REVALIDATE_WORKERS,
+                thread_name_prefix='revalidate',
+            )
+        return _revalidate_executor
+
+
+def revalidate(key, build, timeout, stale_timeout, detach=None):
+    """Обновляет запись get_or_revalidate(), если этого уже не делают."""
+    lock_key = _lock_key(key)
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, settings.CACHE_LOCK_TIMEOUT):
+        return None
+    background = bool(settings.CACHE_REVALIDATE_WORKERS)
+    if detach is not None:
+        try:
+            build = detach()
+        except Exception:
+            logger.exception('Не удалось обновить %s', key)
+            _release(lock_key, token)
+            return None
+
+    def refresh():
+        try:
+            cache.set(key, (build(), time.time() + timeout),
+                      timeout + stale_timeout)
+        except Exception:
+            logger.exception('Не удалось обновить %s', key)
+        finally:
+            _release(lock_key, token)
+            if background:
+                # Соединения потоков пула не закрываются сами.
+                connections.close_all()
+
+    if not background:
+        return refresh()
+    return get_revalidate_executor().submit(refresh)
+
+
+def _stats_key(name, outcome):
+    return f'cache_stats:{name}:{outcome}'
+
+
+def record_lookup(name, hit):
+    """Считает обращение к фрагменту в памяти процесса.
+
+    Запись в кеш на каждый рендер стоила бы нескольких транзакций SQLite,
+    поэтому счетчики уходят в кеш раз в STATS_FLUSH_INTERVAL секунд.
+    """
+    global _lookups_flushed
+    now = time.monotonic()
+    with _lookups_lock:
+        _lookups[_stats_key(name, 'hits' if hit else 'misses')] += 1
+        due = now - _lookups_flushed >= STATS_FLUSH_INTERVAL
+        if due:
+            _lookups_flushed = now
+    if due:
+        flush_lookups()
+
+
+def flush_lookups():
+    """Переносит счетчики record_lookup() процесса в общий кеш."""
+    global _lookups
+    with _lookups_lock:
+        counts, _lookups = _lookups, Counter()
+    for key, amount in counts.items():
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, None):
+                cache.incr(key, amount)
+
+
+def get_stats(names):
+    """Счетчики попаданий и промахов по именам фрагментов."""
+    flush_lookups()
+    keys = {
+        name: (_stats_key(name, 'hits'), _stats_key(name, 'misses'))
+        for name in names
+    }
+    found = cache.get_many([key for pair in keys.values() for key in pair])
+    return {
+        name: {'hits': found.get(hits, 0), 'misses': found.get(misses, 0)}
+        for name, (hits, misses) in keys.items()
+    }
+
+
+def get_tier_stats():
+    """Попадания в L1, L2 и промахи TieredCache по всем процессам."""
+    if hasattr(cache, 'flush_stats'):
+        cache.flush_stats()
+    found = cache.get_many([tier_stats_key(tier) for tier in TIERS])
+    return {tier: found.get(tier_stats_key(tier), 0) for tier in TIERS}
+
+
+# Область страниц, которые целиком кеширует PageCacheMiddleware.
+PAGE_SCOPE = 'pages'
+
+
+def purge_pages():
+    bump_generation(PAGE_SCOPE)
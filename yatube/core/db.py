@@ -0,0 +1,55 @@
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+
+def apply_pragmas(raw_connection, pragmas):
+    """Выполняет PRAGMA name = value на соединении sqlite3."""
+    for name, value in pragmas.items():
+        raw_connection.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created: прагмы SQLITE_PRAGMAS для каждого соединения.
+
+    PRAGMAS алиаса в DATABASES дополняют общие. Выполняются на сыром
+    соединении, мимо execute_wrapper метрик и журнала медленных запросов.
+    """
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection, {
+            **settings.SQLITE_PRAGMAS,
+            **connection.settings_dict.get('PRAGMAS', {}),
+        })
+
+
+def reapply_pragmas(sender, using, **kwargs):
+    """post_migrate: редактор схемы снова включает foreign_keys."""
+    connection = connections[using]
+    if connection.connection is not None:
+        configure_sqlite(sender, connection)
+
+
+def check_connections(**kwargs):
+    """request_started: закрывает постоянные соединения, которые не отвечают.
+
+    В Django 2.2 нет CONN_HEALTH_CHECKS, а is_usable() у SQLite всегда
+    True; закрытое соединение Django откроет заново при первом запросе.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not is_alive(connection):
+            connection.close()
+
+
+def is_alive(connection):
+    if connection.vendor != 'sqlite':
+        return connection.is_usable()
+    try:
+        connection.connection.execute('SELECT 1')
+    except sqlite3.Error:
+        return False
+    return True
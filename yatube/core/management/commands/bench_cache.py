@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import time
+
+from core.sqlite_cache import SQLiteCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость операций SQLiteCache с LocMemCache и '
+            'FileBasedCache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=20)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        params = {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}}
+        backends = (
+            ('locmem', LocMemCache('bench', params)),
+            ('filebased',
+             FileBasedCache(os.path.join(directory, 'files'), params)),
+            ('sqlite',
+             SQLiteCache(os.path.join(directory, 'cache.sqlite3'), params)),
+        )
+        try:
+            for name, backend in backends:
+                results = self.run(backend, options['keys'], options['batch'])
+                self.stdout.write(name + ': ' + ' '.join(
+                    f'{operation}={rate:.0f}/s'
+                    for operation, rate in results.items()
+                ))
+        finally:
+            shutil.rmtree(directory)
+
+    @staticmethod
+    def run(backend, count, batch):
+        keys = [f'bench:{i}' for i in range(count)]
+        value = 'x' * 1024
+        batches = [keys[i:i + batch] for i in range(0, count, batch)]
+        operations = (
+            ('set', lambda: [backend.set(key, value) for key in keys]),
+            ('get', lambda: [backend.get(key) for key in keys]),
+            ('get_many', lambda: [backend.get_many(b) for b in batches]),
+            ('set_many', lambda: [
+                backend.set_many(dict.fromkeys(b, value)) for b in batches
+            ]),
+            ('incr', lambda: [
+                (backend.add('bench:counter', 0),
+                 backend.incr('bench:counter')) for _ in keys
+            ]),
+        )
+        results = {}
+        for operation, callback in operations:
+            started = time.perf_counter()
+            callback()
+            elapsed = time.perf_counter() - started
+            results[operation] = count / elapsed
+        backend.clear()
+        return results
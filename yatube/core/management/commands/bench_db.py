@@ -0,0 +1,136 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from core.db import apply_pragmas
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT,'
+    ' pub_date REAL, comments_count INTEGER DEFAULT 0)',
+    'CREATE INDEX post_pub_date ON post (pub_date)',
+    'CREATE TABLE comment (id INTEGER PRIMARY KEY, post_id INTEGER,'
+    ' text TEXT, created REAL)',
+    'CREATE INDEX comment_post_created ON comment (post_id, created)',
+)
+READ = (
+    'SELECT id, text, pub_date, comments_count FROM post'
+    ' ORDER BY pub_date DESC LIMIT 10'
+)
+
+
+def read(connection, post_id):
+    connection.execute(READ).fetchall()
+
+
+def write(connection, post_id):
+    # Как в posts.signals: комментарий и счетчик поста вместе.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute(
+            'INSERT INTO comment (post_id, text, created) VALUES (?, ?, ?)',
+            [post_id, 'Комментарий', time.time()],
+        )
+        connection.execute(
+            'UPDATE post SET comments_count = comments_count + 1'
+            ' WHERE id = ?',
+            [post_id],
+        )
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite при одновременных '
+            'чтениях ленты и записи комментариев: настройки по умолчанию '
+            'с новым соединением на операцию против SQLITE_PRAGMAS с '
+            'постоянными соединениями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--posts', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        modes = (
+            ('default', {}, False),
+            ('tuned', settings.SQLITE_PRAGMAS, True),
+        )
+        for name, pragmas, persistent in modes:
+            directory = tempfile.mkdtemp()
+            try:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, pragmas, options['posts'])
+                reads, writes, errors = self.run(
+                    path, pragmas, persistent, **options
+                )
+            finally:
+                shutil.rmtree(directory)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{name}: reads={reads / seconds:.0f}/s '
+                f'writes={writes / seconds:.0f}/s locked={errors}'
+            )
+
+    @staticmethod
+    def connect(path, pragmas):
+        connection = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        apply_pragmas(connection, pragmas)
+        return connection
+
+    def seed(self, path, pragmas, posts):
+        connection = self.connect(path, pragmas)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany(
+            'INSERT INTO post (text, pub_date) VALUES (?, ?)',
+            [(f'Пост {i}', time.time() + i) for i in range(posts)],
+        )
+        connection.close()
+
+    def run(self, path, pragmas, persistent, readers, writers, seconds,
+            posts, **options):
+        totals = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def worker(operation, counter):
+            done = errors = 0
+            connection = self.connect(path, pragmas) if persistent else None
+            while time.monotonic() < deadline:
+                current = connection or self.connect(path, pragmas)
+                try:
+                    operation(current, done % posts + 1)
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                finally:
+                    if connection is None:
+                        current.close()
+            if connection is not None:
+                connection.close()
+            with lock:
+                totals[counter] += done
+                totals['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=(read, 'reads'))
+            for _ in range(readers)
+        ] + [
+            threading.Thread(target=worker, args=(write, 'writes'))
+            for _ in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals['reads'], totals['writes'], totals['errors']
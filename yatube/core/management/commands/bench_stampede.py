@@ -0,0 +1,66 @@
+import threading
+import time
+
+from core.cache import get_or_build
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число пересчетов промаха при одновременных '
+            'запросах: без защиты и через get_or_build().')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--build-ms', type=int, default=100)
+
+    def handle(self, *args, **options):
+        for name, fetch in (('naive', self.naive),
+                            ('single-flight', self.single_flight)):
+            builds, elapsed = self.run(fetch, **options)
+            self.stdout.write(
+                f'{name}: rebuilds={builds} '
+                f'per_round={builds / options["rounds"]:.1f} '
+                f'time={elapsed:.2f}s'
+            )
+
+    @staticmethod
+    def naive(key, build):
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache.set(key, value, 60)
+        return value
+
+    @staticmethod
+    def single_flight(key, build):
+        return get_or_build(key, build, 60)[0]
+
+    def run(self, fetch, workers, rounds, build_ms, **options):
+        builds = 0
+        lock = threading.Lock()
+
+        def build():
+            nonlocal builds
+            with lock:
+                builds += 1
+            time.sleep(build_ms / 1000)
+            return 'fragment'
+
+        started = time.monotonic()
+        for round_ in range(rounds):
+            key = f'bench_stampede:{time.time_ns()}:{round_}'
+            barrier = threading.Barrier(workers)
+
+            def worker():
+                barrier.wait()
+                fetch(key, build)
+
+            threads = [threading.Thread(target=worker) for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            cache.delete(key)
+        return builds, time.monotonic() - started
@@ -0,0 +1,28 @@
+from core.cache import get_stats, get_tier_stats
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кеша фрагментов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fragments', nargs='*',
+            default=['index_page', 'group_page', 'profile_page',
+                     'follow_page'],
+        )
+
+    def handle(self, *args, **options):
+        for name, stats in get_stats(options['fragments']).items():
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(
+                f'{name}: hits={stats["hits"]} misses={stats["misses"]} '
+                f'hit_ratio={ratio:.2%}'
+            )
+        tiers = get_tier_stats()
+        total = sum(tiers.values())
+        self.stdout.write('tiers: ' + ' '.join(
+            f'{tier}={count} ({count / total if total else 0:.2%})'
+            for tier, count in tiers.items()
+        ))
@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик через backup API; '
+            'заменяет репликацию при локальной проверке ReplicaRouter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Алиасы реплик; по умолчанию DATABASE_REPLICAS.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд (имитирует задержку реплик).',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Нет реплик: задайте DATABASE_REPLICAS.')
+        source = self.sqlite_name('default')
+        targets = [self.sqlite_name(alias) for alias in aliases]
+        if source in targets:
+            raise CommandError('Реплика указывает на файл default.')
+        while True:
+            for alias, target in zip(aliases, targets):
+                started = time.perf_counter()
+                self.copy(source, target)
+                self.stdout.write(
+                    f'{alias}: {time.perf_counter() - started:.3f}s'
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def sqlite_name(alias):
+        if alias not in connections.databases:
+            raise CommandError(f'Нет базы {alias} в DATABASES.')
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'{alias}: поддерживается только SQLite.')
+        return connection.settings_dict['NAME']
+
+    @staticmethod
+    def copy(source, target):
+        """Согласованный снимок source в target, даже если в source пишут."""
+        source_connection = sqlite3.connect(source)
+        target_connection = sqlite3.connect(target)
+        try:
+            source_connection.backup(target_connection)
+        finally:
+            target_connection.close()
+            source_connection.close()
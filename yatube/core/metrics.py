@@ -0,0 +1,218 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+COUNTERS = (
+    ('db_queries', 'yatube_db_queries_total',
+     'Запросы к БД, выполненные представлением.'),
+    ('db_seconds', 'yatube_db_query_seconds_total',
+     'Время запросов к БД, секунды.'),
+    ('render_seconds', 'yatube_template_render_seconds_total',
+     'Время рендеринга шаблонов, секунды.'),
+    ('response_bytes', 'yatube_response_bytes_total',
+     'Размер тел ответов, байты.'),
+)
+
+# Счетчики каждого потока пишет только он сам, поэтому обновление идет
+# без блокировок; сводка по процессу собирается при сбросе на диск.
+_thread_stores = []
+_thread_stores_lock = threading.Lock()
+_local = threading.local()
+_last_flush = 0.0
+
+
+def new_view_stats():
+    stats = dict.fromkeys((name for name, _, _ in COUNTERS), 0)
+    stats.update(
+        buckets=[0] * len(DURATION_BUCKETS), count=0, duration_sum=0.0
+    )
+    return stats
+
+
+def _thread_store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _thread_stores_lock:
+            _thread_stores.append(store)
+    return store
+
+
+def current():
+    """Счетчики запроса, который сейчас обрабатывает этот поток."""
+    return getattr(_local, 'request', None)
+
+
+def start_request():
+    _local.request = {
+        'db_queries': 0, 'db_seconds': 0.0, 'render_seconds': 0.0,
+        'render_depth': 0, 'view': None,
+    }
+    return _local.request
+
+
+def finish_request(view, duration, response_bytes):
+    measured = current() or start_request()
+    _local.request = None
+    store = _thread_store()
+    stats = store.get(view)
+    if stats is None:
+        stats = store[view] = new_view_stats()
+    for index, bound in enumerate(DURATION_BUCKETS):
+        if duration <= bound:
+            stats['buckets'][index] += 1
+            break
+    stats['count'] += 1
+    stats['duration_sum'] += duration
+    stats['db_queries'] += measured['db_queries']
+    stats['db_seconds'] += measured['db_seconds']
+    stats['render_seconds'] += measured['render_seconds']
+    stats['response_bytes'] += response_bytes
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper, считающий запросы текущего запроса."""
+    measured = current()
+    if measured is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measured['db_queries'] += 1
+        measured['db_seconds'] += time.perf_counter() - started
+
+
+def merge(target, source):
+    for view, stats in source.items():
+        merged = target.setdefault(view, new_view_stats())
+        for key, value in stats.items():
+            if key == 'buckets':
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return target
+
+
+def process_snapshot():
+    snapshot = {}
+    for store in list(_thread_stores):
+        merge(snapshot, dict(store))
+    return snapshot
+
+
+def _snapshot_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'metrics-{pid}.json')
+
+
+def flush(force=False):
+    """Записывает сводку процесса в его файл в METRICS_DIR.
+
+    Каждый процесс пишет только свой файл (через временный и rename),
+    поэтому процессам не нужно договариваться о блокировках.
+    """
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as snapshot_file:
+        json.dump(process_snapshot(), snapshot_file)
+    os.replace(temporary, path)
+
+
+def collect():
+    """Сводка по всем процессам, когда-либо писавшим метрики."""
+    flush(force=True)
+    total = {}
+    pattern = os.path.join(settings.METRICS_DIR, 'metrics-*.json')
+    for path in glob.glob(pattern):
+        try:
+            with open(path) as snapshot_file:
+                merge(total, json.load(snapshot_file))
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _labels(view, **extra):
+    labels = {'view': view, **extra}
+    return ','.join(
+        f'{key}="{_escape(value)}"' for key, value in labels.items()
+    )
+
+
+def render_prometheus(total):
+    """Сводка в текстовом формате Prometheus 0.0.4."""
+    name = 'yatube_request_duration_seconds'
+    lines = [
+        f'# HELP {name} Время обработки запроса представлением.',
+        f'# TYPE {name} histogram',
+    ]
+    for view, stats in sorted(total.items()):
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{_labels(view, le=bound)}}} {cumulative}'
+            )
+        lines.append(
+            f'{name}_bucket{{{_labels(view, le="+Inf")}}} {stats["count"]}'
+        )
+        lines.append(f'{name}_sum{{{_labels(view)}}} {stats["duration_sum"]}')
+        lines.append(f'{name}_count{{{_labels(view)}}} {stats["count"]}')
+    for key, name, help_text in COUNTERS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for view, stats in sorted(total.items()):
+            lines.append(f'{name}{{{_labels(view)}}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MeteredTemplate(Template):
+    def render(self, context=None, request=None):
+        measured = current()
+        if measured is None:
+            return super().render(context, request)
+        measured['render_depth'] += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            measured['render_depth'] -= 1
+            # Вложенный render_to_string уже учтен во внешнем.
+            if not measured['render_depth']:
+                measured['render_seconds'] += time.perf_counter() - started
+
+
+class MeteredDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, замеряющий время рендеринга для метрик."""
+
+    def from_string(self, template_code):
+        return MeteredTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return MeteredTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
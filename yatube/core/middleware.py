@@ -0,0 +1,253 @@
+import hashlib
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import metrics, profiling, routers
+from .cache import PAGE_SCOPE, get_generations
+from .nplusone import detect_nplusone
+
+HOLE_RE = re.compile(r'<!--page-hole:([\w./-]+)-->')
+
+STORED_HEADERS = ('Content-Type', 'Last-Modified')
+
+
+def fill_holes(content, request):
+    """Подставляет в страницу персональные шаблоны текущего запроса."""
+    rendered = {}
+
+    def replace(match):
+        name = match.group(1)
+        if name not in rendered:
+            rendered[name] = render_to_string(name, request=request)
+        return rendered[name]
+
+    return HOLE_RE.sub(replace, content)
+
+
+class PageCacheMiddleware:
+    """Кеш страниц целиком для списков и карточки поста.
+
+    Анонимам отдается готовая страница. Вошедшим пользователям на
+    представлениях из PAGE_CACHE_SHARED_VIEWS отдается общее тело, в
+    которое на лету вставляются шапка и переключатель лент (page_hole).
+    Ключ содержит поколение PAGE_SCOPE, так что purge_pages() сразу
+    делает все страницы устаревшими.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        keys = getattr(request, '_page_cache_keys', None)
+        if keys is None:
+            return response
+        request.page_cache_holes = False
+        if not self.can_store(request, response):
+            return response
+        shared_key, anonymous_key = keys
+        charset = response.charset
+        shared = response.content.decode(charset)
+        headers = {
+            name: response[name] for name in STORED_HEADERS
+            if response.has_header(name)
+        }
+        entries = {shared_key: (shared, headers)}
+        response.content = fill_holes(shared, request).encode(charset)
+        if anonymous_key:
+            anonymous_headers = dict(headers)
+            if response.has_header('ETag'):
+                anonymous_headers['ETag'] = response['ETag']
+            entries[anonymous_key] = (
+                response.content.decode(charset), anonymous_headers
+            )
+        cache.set_many(entries, settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or getattr(request, 'profile_mode', None)):
+            return None
+        view_name = request.resolver_match.view_name
+        if view_name not in settings.PAGE_CACHE_VIEWS:
+            return None
+        anonymous = not request.user.is_authenticated
+        shared_views = settings.PAGE_CACHE_SHARED_VIEWS
+        if not anonymous and view_name not in shared_views:
+            return None
+        shared_key = self.cache_key(request, view_name)
+        anonymous_key = f'{shared_key}:anonymous' if anonymous else None
+        found = cache.get_many(
+            [key for key in (shared_key, anonymous_key) if key]
+        )
+        if anonymous_key in found:
+            content, headers = found[anonymous_key]
+            return self.cached_response(request, content, headers)
+        if shared_key in found:
+            content, headers = found[shared_key]
+            content = fill_holes(content, request)
+            if anonymous_key:
+                cache.set(anonymous_key, (content, headers),
+                          settings.PAGE_CACHE_TIMEOUT)
+            return self.cached_response(request, content, headers)
+        request._page_cache_keys = (shared_key, anonymous_key)
+        request.page_cache_holes = True
+        return None
+
+    @staticmethod
+    def cache_key(request, view_name):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        generation, = get_generations([PAGE_SCOPE])
+        return f'page:{view_name}:{path}:{generation}'
+
+    @staticmethod
+    def can_store(request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+        )
+
+    @staticmethod
+    def cached_response(request, content, headers):
+        response = HttpResponse(content)
+        for name, value in headers.items():
+            response[name] = value
+        last_modified = response.get('Last-Modified')
+        if last_modified:
+            last_modified = parse_http_date_safe(last_modified)
+        return get_conditional_response(
+            request, etag=response.get('ETag'), last_modified=last_modified,
+            response=response,
+        )
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса по имени представления для /metrics.
+
+    Ставится первым, чтобы время включало остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.record_query)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        size = 0 if response.streaming else len(response.content)
+        metrics.finish_request(
+            match.view_name if match else 'unresolved', duration, size
+        )
+        metrics.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        measured = metrics.current()
+        if measured is not None:
+            measured['view'] = request.resolver_match.view_name
+
+
+class NPlusOneMiddleware:
+    """Ищет N+1 в доле NPLUSONE_SAMPLE_RATE запросов, если NPLUSONE_ENABLED.
+
+    Находки пишутся в лог, а с NPLUSONE_RAISE запрос падает с
+    NPlusOneError (удобно на staging и в тестах).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (not settings.NPLUSONE_ENABLED
+                or random.random() >= settings.NPLUSONE_SAMPLE_RATE):
+            return self.get_response(request)
+        with detect_nplusone(raise_errors=settings.NPLUSONE_RAISE) as found:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        found.finish(match.view_name if match else None)
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос персонала с ?_profile=1 или X-Profile: 1.
+
+    Профиль и отчет сохраняются в PROFILING_DIR (имя - в заголовке
+    X-Profile-Id, список - в admin/profiles/); со значением show вместо
+    страницы возвращается отчет. Профилируемые запросы идут мимо кеша
+    страниц. Ставится после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        request.profile_mode = mode
+        response, profile, summary = profiling.run(
+            self.get_response, request
+        )
+        if profile is None:
+            return response
+        report = profiling.build_report(profile, summary, request)
+        name = profiling.save(profile, report, request)
+        if mode == 'show':
+            response = HttpResponse(
+                report, content_type='text/plain; charset=utf-8'
+            )
+        response['X-Profile-Id'] = name
+        return response
+
+
+class ReplicaPinMiddleware:
+    """Читает с основной базы, пока реплики могут не видеть записи клиента.
+
+    Небезопасные методы целиком идут в default. После записи ответ ставит
+    cookie REPLICA_PIN_COOKIE на REPLICA_PIN_SECONDS (больше задержки
+    репликации), поэтому и страница после редиректа из add_comment
+    читается из default. Остальные клиенты читают с реплик; в default
+    после записи идет только наполнение кеша под поколениями
+    (core.cache.get_generations).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        routers.reset(
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or settings.REPLICA_PIN_COOKIE in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+            if routers.wrote():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                    samesite='Lax',
+                )
+        finally:
+            routers.reset()
+        return response
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import migrations
+
+OLD_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+NEW_BACKEND = 'core.auth.CachedModelBackend'
+
+
+def move_sessions(apps, schema_editor, old=OLD_BACKEND, new=NEW_BACKEND):
+    """Переводит открытые сессии со старого бэкенда на новый.
+
+    Иначе после удаления ModelBackend из AUTHENTICATION_BACKENDS они бы
+    разлогинились. Копии сессий в кеше (cached_db) удаляются.
+    """
+    Session = apps.get_model('sessions', 'Session')
+    store = SessionStore()
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    sessions = Session.objects.using(schema_editor.connection.alias)
+    for session in sessions.iterator():
+        data = store.decode(session.session_data)
+        if data.get(BACKEND_SESSION_KEY) != old:
+            continue
+        data[BACKEND_SESSION_KEY] = new
+        session.session_data = store.encode(data)
+        session.save(update_fields=['session_data'])
+        cache.delete(KEY_PREFIX + session.session_key)
+
+
+def restore_sessions(apps, schema_editor):
+    move_sessions(apps, schema_editor, old=NEW_BACKEND, new=OLD_BACKEND)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_sessions, restore_sessions),
+    ]
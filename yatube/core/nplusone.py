@@ -0,0 +1,103 @@
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+from .slow_queries import call_site
+
+logger = logging.getLogger(__name__)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def normalize(sql):
+    """Форма запроса: литералы и списки IN заменены на '?'."""
+    shape = STRING_RE.sub('?', sql)
+    shape = NUMBER_RE.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = IN_LIST_RE.sub('IN (?)', shape)
+    return SPACE_RE.sub(' ', shape).strip()
+
+
+def template_origin():
+    """Шаблон и строка тега, который сейчас рендерится, или место в коде."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        if isinstance(node, Node) and getattr(node, 'token', None):
+            origin = node.origin
+            name = origin.template_name or origin.name
+            return f'{name}:{node.token.lineno}'
+        frame = frame.f_back
+    return call_site(skip={__file__})
+
+
+class Detector:
+    """execute_wrapper, считающий повторы запросов одной формы.
+
+    Повтор формы threshold раз считается N+1. С raise_errors исключение
+    поднимается прямо в повторном запросе, иначе finish() пишет
+    предупреждение в лог.
+    """
+
+    def __init__(self, threshold, raise_errors):
+        self.threshold = threshold
+        self.raise_errors = raise_errors
+        self.counts = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            shape = normalize(sql)
+            self.counts[shape] += 1
+            count = self.counts[shape]
+            if count == 2:
+                self.origins[shape] = template_origin()
+            if count == self.threshold and self.raise_errors:
+                raise NPlusOneError(self.message(shape))
+        return execute(sql, params, many, context)
+
+    def message(self, shape, view=None):
+        where = self.origins.get(shape)
+        if view:
+            where = f'{view}, {where}'
+        return (f'N+1: запрос повторился {self.counts[shape]} раз '
+                f'({where}): {shape}')
+
+    def problems(self):
+        return [
+            shape for shape, count in self.counts.items()
+            if count >= self.threshold
+        ]
+
+    def finish(self, view=None):
+        for shape in self.problems():
+            logger.warning(self.message(shape, view))
+
+
+@contextmanager
+def detect_nplusone(threshold=None, raise_errors=True):
+    """Включает детектор на всех соединениях внутри блока.
+
+    with detect_nplusone():
+        client.get(url)
+    """
+    detector = Detector(
+        threshold or settings.NPLUSONE_THRESHOLD, raise_errors
+    )
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(detector))
+        yield detector
@@ -0,0 +1,114 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+
+NAME_RE = re.compile(r'^[\w.-]+$')
+
+SUMMARY_KEYS = ('db_queries', 'db_seconds', 'render_seconds')
+
+
+def requested_mode(request):
+    """'store' или 'show', если персонал попросил профиль запроса.
+
+    Включается параметром PROFILING_PARAM или заголовком X-Profile;
+    значение 'show' заменяет страницу отчетом.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return None
+    value = (request.GET.get(settings.PROFILING_PARAM)
+             or request.META.get('HTTP_X_PROFILE'))
+    if not value:
+        return None
+    return 'show' if value == 'show' else 'store'
+
+
+def run(get_response, request):
+    """Выполняет запрос под cProfile.
+
+    Возвращает ответ, профиль (None, если уже работает другой
+    профилировщик, например отладчик) и сводку: общее время, запросы и
+    время БД, время шаблонов - только за время профилирования.
+    """
+    # Без MetricsMiddleware запросы БД и шаблоны не считаются.
+    measured = metrics.current() or dict.fromkeys(SUMMARY_KEYS, 0)
+    before = {key: measured[key] for key in SUMMARY_KEYS}
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return get_response(request), None, None
+    started = time.perf_counter()
+    try:
+        response = get_response(request)
+    finally:
+        profile.disable()
+    summary = {key: measured[key] - before[key] for key in SUMMARY_KEYS}
+    summary['duration'] = time.perf_counter() - started
+    return response, profile, summary
+
+
+def build_report(profile, summary, request):
+    """Сводка по БД и шаблонам и дерево вызовов по cumulative времени."""
+    match = getattr(request, 'resolver_match', None)
+    duration = summary['duration']
+    db_seconds = summary['db_seconds']
+    render_seconds = summary['render_seconds']
+    lines = [
+        f'view: {match.view_name if match else "-"}',
+        f'path: {request.get_full_path()}',
+        f'release: {settings.PROFILING_RELEASE}',
+        f'date: {timezone.now().isoformat()}',
+        f'total: {duration:.4f} s',
+        f'db: {summary["db_queries"]} queries, {db_seconds:.4f} s',
+        f'templates: {render_seconds:.4f} s',
+        f'other: {max(duration - db_seconds - render_seconds, 0):.4f} s',
+        '',
+    ]
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP)
+    stats.print_callees(settings.PROFILING_TOP // 4)
+    return '\n'.join(lines) + stream.getvalue()
+
+
+def save(profile, report, request):
+    """Сохраняет .prof (для pstats/snakeviz) и текстовый отчет; имя файла."""
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name.replace(':', '-') if match else 'unresolved'
+    release = re.sub(r'[^\w.-]', '_', str(settings.PROFILING_RELEASE))
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    name = f'{stamp}_{release}_{view}_{uuid.uuid4().hex[:6]}'
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    profile.dump_stats(os.path.join(settings.PROFILING_DIR, f'{name}.prof'))
+    with open(os.path.join(settings.PROFILING_DIR, f'{name}.txt'), 'w',
+              encoding='utf-8') as report_file:
+        report_file.write(report)
+    return name
+
+
+def list_profiles():
+    """Имена сохраненных профилей, от новых к старым."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    return sorted(
+        (name for name in os.listdir(settings.PROFILING_DIR)
+         if NAME_RE.match(name)),
+        reverse=True,
+    )
+
+
+def profile_path(name):
+    if not NAME_RE.match(name) or name.startswith('.'):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,78 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+RECENT_WRITE_KEY = 'replicas:recent_write'
+
+_state = threading.local()
+
+
+def reset(pinned=False):
+    """Начало запроса: чтения с реплик, если pinned не требует иного."""
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def wrote():
+    """Писал ли поток в базу с последнего reset()."""
+    return getattr(_state, 'wrote', False)
+
+
+def pin():
+    _state.pinned = True
+
+
+def mark_recent_write():
+    """Запись бампает поколения кеша сразу, а до реплик доходит позже.
+
+    Пока ключ жив (REPLICA_PIN_SECONDS), get_generations() закрепляет за
+    default запросы, которые наполняют кеш под поколениями, иначе старые
+    данные реплики попали бы в кеш под новым поколением.
+    """
+    cache.set(RECENT_WRITE_KEY, True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    """Читает модели из REPLICATED_MODELS с реплик DATABASE_REPLICAS.
+
+    Запись всегда идет в default. Запись модели из REPLICATED_MODELS
+    закрепляет поток за default до конца запроса, так что запрос видит
+    свои изменения; следующему запросу того же клиента закрепление передает
+    ReplicaPinMiddleware. Сессии, last_login и прочие модели, которые
+    читаются только из default, ничего не закрепляют.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned():
+            return 'default'
+        if model._meta.label not in settings.REPLICATED_MODELS:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db not in {
+            None, *self.databases()
+        }:
+            # Объект другой базы (шарда, migrate --database) пишется туда же.
+            return None
+        if model._meta.label in settings.REPLICATED_MODELS:
+            _state.pinned = _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии default, объекты из них можно связывать.
+        if {obj1._state.db, obj2._state.db} <= self.databases():
+            return True
+        return None
+
+    @staticmethod
+    def databases():
+        return {'default', *settings.DATABASE_REPLICAS}
@@ -0,0 +1,249 @@
+import heapq
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, models
+from django.db.models import prefetch_related_objects
+
+from .db import check_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.SHARDS)
+
+
+def shard_for(key, shards=None):
+    """Алиас шарда для ключа; crc32 одинаков во всех процессах."""
+    shards = settings.SHARDS if shards is None else shards
+    return shards[zlib.crc32(str(key).encode()) % len(shards)]
+
+
+def shard_key(instance):
+    """Ключ шарда объекта по пути из SHARDED_MODELS ('post.author_id').
+
+    Связи проходятся только уже загруженные: запрос отсюда снова
+    попал бы в роутер.
+    """
+    path = settings.SHARDED_MODELS[instance._meta.label].split('.')
+    value = instance
+    for name in path[:-1]:
+        field = value._meta.get_field(name)
+        if not field.is_cached(value):
+            return None
+        value = getattr(value, name)
+        if value is None:
+            return None
+    return getattr(value, path[-1])
+
+
+def is_sharded(model):
+    return enabled() and model._meta.label in settings.SHARDED_MODELS
+
+
+def db_for(model, key):
+    """Шард ключа или None (обычная маршрутизация) для нешардированных."""
+    return shard_for(key) if is_sharded(model) else None
+
+
+def aliases():
+    """Базы с таблицами шардированных моделей; [None] - только default."""
+    return list(settings.SHARDS) or [None]
+
+
+def related(queryset, *lookups):
+    """select_related на одной базе; на шардах связанные объекты лежат в
+    default, поэтому они подгружаются prefetch_related."""
+    if is_sharded(queryset.model):
+        return queryset.prefetch_related(*lookups)
+    return queryset.select_related(*lookups)
+
+
+class ShardRouter:
+    """Модели из SHARDED_MODELS пишутся и читаются на шарде ключа.
+
+    Роутер видит только объекты из hints (сохранение, связанные
+    менеджеры); выборки без объекта указывают шард сами через using()
+    или ShardedQuerySet. Объект, шард которого не определить (например,
+    Comment(post_id=...) без загруженного поста), дает ValueError: в
+    default он потерялся бы без ошибки.
+    """
+
+    def _route(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None or not is_sharded(instance):
+            return None
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        key = shard_key(instance)
+        if key is None:
+            raise ValueError(
+                f'Шард {instance._meta.label} не определить: загрузите '
+                f'связь из SHARDED_MODELS или укажите using()'
+            )
+        return shard_for(key)
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Шардированные объекты ссылаются на пользователей и группы в default.
+        if is_sharded(obj1) or is_sharded(obj2):
+            return True
+        return None
+
+
+class ShardKeyQuerySet(models.QuerySet):
+    """create() без using() пишет на шард объекта.
+
+    QuerySet.create() передает save() базу модели, а роутеру без
+    объекта шард неизвестен.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None or not is_sharded(self.model):
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SHARD_WORKERS,
+                thread_name_prefix='shard',
+            )
+        return _executor
+
+
+def in_pool(function):
+    """Обертка для потоков пула: у них свои соединения, а request_started
+    и request_finished закрывают только соединения потока запроса."""
+    @wraps(function)
+    def wrapper(*args):
+        close_old_connections()
+        check_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def run_on_shards(function, aliases):
+    """function(alias) на каждом шарде параллельно; результаты по порядку.
+
+    С SHARD_WORKERS = 0 шарды опрашиваются по очереди.
+    """
+    if settings.SHARD_WORKERS and len(aliases) > 1:
+        return list(get_executor().map(in_pool(function), aliases))
+    return [function(alias) for alias in aliases]
+
+
+class Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class ShardedQuerySet:
+    """Выборка со всех шардов, слитая по order_by (k-way merge).
+
+    Поддерживает то, что нужно Paginator и CursorPaginator: filter,
+    order_by, none, count и срезы. Срез [a:b] берет с каждого шарда
+    первые b строк, так что глубокие страницы дороже, чем на одной базе.
+    prefetch_related выполняется один раз для слитой страницы.
+    """
+
+    ordered = True
+
+    def __init__(self, queryset, aliases=None):
+        self.prefetch = queryset._prefetch_related_lookups
+        self.queryset = queryset.prefetch_related(None)
+        self.aliases = list(settings.SHARDS if aliases is None else aliases)
+        self.model = queryset.model
+
+    def _clone(self, queryset):
+        return type(self)(
+            queryset.prefetch_related(*self.prefetch), self.aliases
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.queryset.filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._clone(self.queryset.exclude(*args, **kwargs))
+
+    def order_by(self, *field_names):
+        return self._clone(self.queryset.order_by(*field_names))
+
+    def none(self):
+        return type(self)(self.queryset.none(), [])
+
+    def ordering(self):
+        query = self.queryset.query
+        if query.order_by:
+            return query.order_by
+        if query.default_ordering:
+            return self.model._meta.ordering
+        return ()
+
+    def sort_key(self):
+        fields = []
+        for field in self.ordering():
+            if not isinstance(field, str):
+                raise TypeError(f'Слияние по {field!r} не поддерживается')
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            fields.append(('pk' if name == 'id' else name, descending))
+
+        def key(obj):
+            return tuple(
+                Descending(getattr(obj, name)) if descending
+                else getattr(obj, name)
+                for name, descending in fields
+            )
+        return key
+
+    def count(self):
+        return sum(run_on_shards(
+            lambda alias: self.queryset.using(alias).count(), self.aliases
+        ))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        rows = run_on_shards(
+            lambda alias: list(self.queryset.using(alias)[:stop]),
+            self.aliases,
+        )
+        page = list(islice(
+            heapq.merge(*rows, key=self.sort_key()), start, stop
+        ))
+        prefetch_related_objects(page, *self.prefetch)
+        return page
+
+    def __iter__(self):
+        return iter(self[0:None])
@@ -0,0 +1,105 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+NEXT_SLOT_KEY = 'slow_queries:next'
+
+_local = threading.local()
+
+# Обертки execute сами не считаются местом вызова.
+SKIPPED_FILES = {__file__, metrics.__file__}
+
+
+def _slot_key(index):
+    return f'slow_queries:{index % settings.SLOW_QUERY_LOG_SIZE}'
+
+
+def install(sender, connection, **kwargs):
+    """connection_created: ставит log_slow_query на каждое соединение."""
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+def log_slow_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        if duration >= settings.SLOW_QUERY_THRESHOLD:
+            record(sql, params, duration)
+
+
+def call_site(skip=()):
+    """Первый кадр кода проекта в стеке: 'posts/views.py:profile'.
+
+    Файлы из skip, как и сами обертки execute, пропускаются.
+    """
+    base_dir = settings.BASE_DIR + os.sep
+    skipped = SKIPPED_FILES.union(skip)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base_dir) and filename not in skipped
+                and os.sep + 'site-packages' + os.sep not in filename):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def record(sql, params, duration):
+    # Запись в кеш не должна сама попасть в журнал, если кеш живет в БД.
+    if getattr(_local, 'recording', False):
+        return
+    _local.recording = True
+    try:
+        measured = metrics.current() or {}
+        entry = {
+            'sql': sql[:2000],
+            'params': repr(params)[:500],
+            'duration': duration,
+            'view': measured.get('view'),
+            'call_site': call_site(),
+            'time': timezone.now(),
+        }
+        logger.warning(
+            'Медленный запрос %.3f с (%s, %s): %s; параметры %s',
+            duration, entry['view'], entry['call_site'], entry['sql'],
+            entry['params'],
+        )
+        # Кольцевой буфер в общем кеше: incr атомарен между процессами.
+        try:
+            index = cache.incr(NEXT_SLOT_KEY)
+        except ValueError:
+            cache.add(NEXT_SLOT_KEY, 0, None)
+            index = cache.incr(NEXT_SLOT_KEY)
+        cache.set(_slot_key(index), entry, None)
+    except Exception:
+        logger.exception('Не удалось записать медленный запрос')
+    finally:
+        _local.recording = False
+
+
+def slowest():
+    """Записи кольцевого буфера от самой медленной к самой быстрой."""
+    keys = [_slot_key(i) for i in range(settings.SLOW_QUERY_LOG_SIZE)]
+    entries = cache.get_many(keys).values()
+    return sorted(entries, key=lambda entry: entry['duration'], reverse=True)
+
+
+def clear():
+    cache.delete_many(
+        [NEXT_SLOT_KEY]
+        + [_slot_key(i) for i in range(settings.SLOW_QUERY_LOG_SIZE)]
+    )
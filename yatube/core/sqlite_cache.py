@@ -0,0 +1,335 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+# Лимит переменных в одном запросе у старых сборок SQLite.
+MAX_VARIABLES = 900
+# Время доступа для LRU обновляется не чаще раза в секунду, чтобы
+# горячие чтения не превращались в запись.
+ACCESS_RESOLUTION = 1.0
+
+
+def ensure_private(location):
+    """Создает файл кеша с правами 0600 и проверяет уже существующий.
+
+    Значения из файла распаковывает pickle: файл, в который может писать
+    кто-то кроме владельца процесса, дал бы ему выполнить свой код.
+    """
+    directory = os.path.dirname(location)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    descriptor = os.open(
+        location, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600
+    )
+    try:
+        stat = os.fstat(descriptor)
+    finally:
+        os.close(descriptor)
+    if stat.st_uid != os.getuid():
+        raise ImproperlyConfigured(
+            f'{location}: файл кеша принадлежит другому пользователю.'
+        )
+    if stat.st_mode & 0o077:
+        raise ImproperlyConfigured(
+            f'{location}: файл кеша доступен не только владельцу.'
+        )
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в общем файле SQLite, видимый всем процессам на машине.
+
+    LOCATION - путь к файлу. Операции чтения-изменения-записи (add, incr)
+    идут в транзакции BEGIN IMMEDIATE, поэтому атомарны между процессами.
+    При превышении MAX_ENTRIES вытесняется 1/CULL_FREQUENCY записей,
+    к которым дольше всего не обращались (LRU).
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self.busy_timeout = int(
+            params.get('OPTIONS', {}).get('BUSY_TIMEOUT', 5000)
+        )
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Соединение свое у каждого потока и у каждого процесса после fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        ensure_private(self.location)
+        connection = sqlite3.connect(
+            self.location, timeout=self.busy_timeout / 1000,
+            isolation_level=None, check_same_thread=False,
+        )
+        connection.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    def _write(self, callback):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = callback(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    @staticmethod
+    def _chunks(items):
+        items = list(items)
+        for start in range(0, len(items), MAX_VARIABLES):
+            yield items[start:start + MAX_VARIABLES]
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _fetch(self, connection, keys, now):
+        """Словарь ключ -> (значение, срок, время доступа) живых записей."""
+        found = {}
+        for chunk in self._chunks(keys):
+            placeholders = ', '.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT key, value, expires, accessed FROM cache'
+                f' WHERE key IN ({placeholders})'
+                f' AND (expires IS NULL OR expires > ?)',
+                [*chunk, now],
+            )
+            found.update((key, (value, expires, accessed))
+                         for key, value, expires, accessed in rows)
+        return found
+
+    def _touch_accessed(self, connection, keys, now):
+        for chunk in self._chunks(keys):
+            placeholders = ', '.join('?' * len(chunk))
+            connection.execute(
+                f'UPDATE cache SET accessed = ? WHERE key IN ({placeholders})',
+                [now, *chunk],
+            )
+
+    def _store(self, connection, rows):
+        connection.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed)'
+            ' VALUES (?, ?, ?, ?)',
+            rows,
+        )
+
+    def _cull(self, connection):
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            [time.time()],
+        )
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        excess = count - self._max_entries
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            [max(excess, count // self._cull_frequency)],
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._get_many_raw([key]).get(key)
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        return {
+            key: value
+            for key, (value, _) in self.get_many_with_expiry(
+                keys, version=version
+            ).items()
+        }
+
+    def get_many_with_expiry(self, keys, version=None):
+        """Словарь ключ -> (значение, срок по time.time() или None)."""
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        return {
+            made[key]: (pickle.loads(value), expires)
+            for key, (value, expires) in self._get_many_raw(made).items()
+        }
+
+    def _get_many_raw(self, keys):
+        if not keys:
+            return {}
+        connection = self.connection
+        now = time.time()
+        found = self._fetch(connection, keys, now)
+        outdated = [
+            key for key, (_, _, accessed) in found.items()
+            if accessed < now - ACCESS_RESOLUTION
+        ]
+        if outdated:
+            self._touch_accessed(connection, outdated, now)
+        return {
+            key: (value, expires) for key, (value, expires, _) in found.items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self._dumps(value), expires, now))
+
+        def write(connection):
+            if timeout == 0:
+                connection.executemany(
+                    'DELETE FROM cache WHERE key = ?',
+                    [row[:1] for row in rows],
+                )
+                return
+            self._store(connection, rows)
+            self._cull(connection)
+
+        self._write(write)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        row = (key, self._dumps(value), expires, time.time())
+
+        def write(connection):
+            if self._fetch(connection, [key], row[3]):
+                return False
+            self._store(connection, [row])
+            self._cull(connection)
+            return True
+
+        return self._write(write)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        cursor = self._write(lambda connection: connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            [expires, key, time.time()],
+        ))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def write(connection):
+            now = time.time()
+            found = self._fetch(connection, [key], now)
+            if key not in found:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(found[key][0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                [self._dumps(value), now, key],
+            )
+            return value
+
+        return self._write(write)
+
+    def incr_many(self, keys, delta=1, initial=None, version=None):
+        """Увеличивает ключи одной транзакцией; словарь новых значений.
+
+        Отсутствующие ключи заводятся без срока со значением initial, а при
+        initial=None пропускаются.
+        """
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+
+        def write(connection):
+            now = time.time()
+            found = self._fetch(connection, made, now)
+            values, updated, created = {}, [], []
+            for key, original in made.items():
+                if key in found:
+                    value = pickle.loads(found[key][0]) + delta
+                    updated.append((self._dumps(value), now, key))
+                elif initial is not None:
+                    value = initial
+                    created.append((key, self._dumps(value), None, now))
+                else:
+                    continue
+                values[original] = value
+            connection.executemany(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                updated,
+            )
+            if created:
+                self._store(connection, created)
+                self._cull(connection)
+            return values
+
+        return self._write(write)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            [key, time.time()],
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._write(lambda connection: connection.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+        ))
+
+    def clear(self):
+        self._write(lambda connection: connection.execute('DELETE FROM cache'))
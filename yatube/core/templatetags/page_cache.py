@@ -0,0 +1,36 @@
+from django import template
+
+register = template.Library()
+
+HOLE_MARKER = '<!--page-hole:{}-->'
+
+
+class PageHoleNode(template.Node):
+    def __init__(self, template_name):
+        self.template_name = template_name
+
+    def render(self, context):
+        name = self.template_name.resolve(context)
+        request = context.get('request')
+        if getattr(request, 'page_cache_holes', False):
+            return HOLE_MARKER.format(name)
+        return context.template.engine.get_template(name).render(context)
+
+
+@register.tag
+def page_hole(parser, token):
+    """
+    Персональная часть страницы, которую нельзя класть в общий кеш.
+
+    {% page_hole 'includes/header.html' %}
+
+    Обычно работает как include. Когда страницу рендерит
+    PageCacheMiddleware, вместо шаблона выводится метка, а сам шаблон
+    рендерится для текущего пользователя при каждой отдаче из кеша.
+    """
+    tokens = token.split_contents()
+    if len(tokens) != 2:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires exactly one argument.'
+        )
+    return PageHoleNode(parser.compile_filter(tokens[1]))
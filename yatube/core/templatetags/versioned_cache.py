@@ -0,0 +1,139 @@
+from copy import copy
+
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import QuerySet
+from django.templatetags.cache import CacheNode
+from django.utils import timezone, translation
+
+from core.cache import (get_generations, get_or_build, get_or_revalidate,
+                        record_lookup, scope_for)
+
+register = template.Library()
+
+
+class RequestSnapshot:
+    """То, что фрагменты берут из request, без самого запроса."""
+
+    def __init__(self, request):
+        self.GET = request.GET.copy()
+        self.path = request.path
+        self.full_path = request.get_full_path()
+
+    def get_full_path(self):
+        return self.full_path
+
+
+def detach_value(value):
+    """Копия значения контекста, не разделяющая ленивых выборок с запросом:
+    пул вычислит их на своем соединении."""
+    if isinstance(value, QuerySet):
+        return value.all()
+    object_list = getattr(value, 'object_list', None)
+    if isinstance(object_list, QuerySet):
+        value = copy(value)
+        value.object_list = object_list.all()
+    return value
+
+
+class VersionedCacheNode(CacheNode):
+    def __init__(self, nodelist, expire_time_var, fragment_name, scope_var,
+                 vary_on, stale_var=None):
+        super().__init__(nodelist, expire_time_var, fragment_name, vary_on,
+                         None)
+        self.scope_var = scope_var
+        self.stale_var = stale_var
+
+    def get_scopes(self, context):
+        scopes = self.scope_var.resolve(context)
+        if not isinstance(scopes, (list, tuple)):
+            scopes = [scopes]
+        return [scope_for(scope) for scope in scopes]
+
+    def render(self, context):
+        expire_time = self.expire_time_var.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        generations = get_generations(self.get_scopes(context))
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        cache_key = make_template_fragment_key(
+            self.fragment_name, vary_on + generations
+        )
+        stale_key = make_template_fragment_key(
+            f'{self.fragment_name}.stale', vary_on
+        )
+        if self.stale_var is None:
+            value, hit = get_or_build(
+                cache_key, lambda: self.nodelist.render(context),
+                expire_time, stale_key=stale_key,
+            )
+        else:
+            value, hit = get_or_revalidate(
+                f'{cache_key}:swr', lambda: self.nodelist.render(context),
+                expire_time, int(self.stale_var.resolve(context)),
+                stale_key=f'{stale_key}:swr',
+                detach=lambda: self.detach(context),
+            )
+        record_lookup(self.fragment_name, hit)
+        return value
+
+    def detach(self, context):
+        """Рендер фрагмента для пула из снимка контекста.
+
+        Снимок берется в потоке запроса: request заменяет RequestSnapshot,
+        ленивые выборки - их копии, язык и часовой пояс запоминаются.
+        """
+        values = {
+            name: detach_value(value)
+            for name, value in context.flatten().items()
+        }
+        if values.get('request') is not None:
+            values['request'] = RequestSnapshot(values['request'])
+        detached = template.Context(
+            values, autoescape=context.autoescape,
+            use_l10n=context.use_l10n, use_tz=context.use_tz,
+        )
+        origin = context.template
+        language = translation.get_language()
+        zone = timezone.get_current_timezone()
+
+        def render():
+            with translation.override(language), timezone.override(zone), \
+                    detached.bind_template(origin):
+                return self.nodelist.render(detached)
+        return render
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """
+    Кеширует фрагмент до изменения данных области (scope).
+
+    {% versioned_cache [expire_time] [fragment_name] [scope] [var1] ..
+                       [stale=seconds] %}
+
+    scope - строка, объект модели или список таких значений; его поколение
+    входит в ключ, поэтому bump_generation() сразу делает фрагмент
+    устаревшим и expire_time может быть большим. Пересчет идет через
+    get_or_build(): пока один запрос рендерит фрагмент, остальные получают
+    прошлую версию.
+
+    С stale=N фрагмент после expire_time еще N секунд отдается из кеша
+    (stale-while-revalidate): все запросы сразу получают старую версию, а
+    новую рендерит пул потоков по снимку контекста.
+    """
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    stale_var = None
+    if tokens[-1].startswith('stale='):
+        stale_var = parser.compile_filter(tokens.pop()[len('stale='):])
+    if len(tokens) < 4:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 3 arguments.'
+        )
+    return VersionedCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        parser.compile_filter(tokens[3]),
+        [parser.compile_filter(t) for t in tokens[4:]], stale_var,
+    )
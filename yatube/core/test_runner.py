@@ -0,0 +1,45 @@
+import copy
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def test_settings():
+    """TEST_OVERRIDES и CACHES с файлом CACHE_FILE во временном каталоге.
+
+    Тесты вызывают cache.clear(); с общим файлом они стирали бы кеш
+    запущенного рядом сервера.
+    """
+    directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+    location = os.path.join(directory, os.path.basename(settings.CACHE_FILE))
+    caches = copy.deepcopy(settings.CACHES)
+    for params in caches.values():
+        if params.get('LOCATION') == settings.CACHE_FILE:
+            params['LOCATION'] = location
+        options = params.get('OPTIONS', {})
+        if options.get('CHANNEL') == settings.CACHE_FILE:
+            options['CHANNEL'] = location
+    try:
+        with override_settings(CACHES=caches, **settings.TEST_OVERRIDES):
+            yield location
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner, который включает test_settings() на время тестов."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._settings = test_settings()
+        self._settings.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,335 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .sqlite_cache import ensure_private
+
+TIERS = ('l1_hits', 'l2_hits', 'misses')
+
+# Сколько секунд хранятся записи канала; узел, который опрашивал его
+# реже, очищает L1 целиком.
+CHANNEL_RETENTION = 60
+
+CLEAR_ALL = '*'
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def tier_stats_key(tier):
+    return f'cache_stats:tier:{tier}'
+
+
+class InvalidationChannel:
+    """Журнал измененных ключей в общем файле SQLite.
+
+    Узлы дописывают ключи при записи и читают журнал с последнего
+    увиденного номера, чтобы выбросить эти ключи из своего L1.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.node = uuid.uuid4().hex
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            ensure_private(self.location)
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_invalidations ('
+                ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' node TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' created REAL NOT NULL)'
+            )
+            # publish() чистит старые записи на каждой записи в кеш.
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_invalidations_created'
+                ' ON cache_invalidations (created)'
+            )
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def last_seq(self):
+        seq, = self.connection.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations'
+        ).fetchone()
+        return seq
+
+    def publish(self, keys):
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO cache_invalidations (node, key, created)'
+                ' VALUES (?, ?, ?)',
+                [(self.node, key, now) for key in keys],
+            )
+            connection.execute(
+                'DELETE FROM cache_invalidations WHERE created < ?',
+                [now - CHANNEL_RETENTION],
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def read(self, after):
+        """Номер последней записи и чужие ключи после номера after."""
+        rows = self.connection.execute(
+            'SELECT seq, node, key FROM cache_invalidations WHERE seq > ?'
+            ' ORDER BY seq',
+            [after],
+        ).fetchall()
+        if not rows:
+            return after, []
+        return rows[-1][0], [
+            key for _, node, key in rows if node != self.node
+        ]
+
+
+class LocalTier:
+    """L1 одного процесса: общий для всех потоков LRU со сроком жизни."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_seq = channel.last_seq()
+        self.last_poll = time.monotonic()
+        self.stats = dict.fromkeys(TIERS, 0)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, timeout, max_entries):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            if CLEAR_ALL in keys:
+                self.entries.clear()
+                return
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def count(self, tier, amount=1):
+        with self.lock:
+            self.stats[tier] += amount
+
+    def take_stats(self):
+        with self.lock:
+            stats, self.stats = self.stats, dict.fromkeys(TIERS, 0)
+        return stats
+
+
+class TieredCache(BaseCache):
+    """Небольшой LRU в памяти процесса (L1) перед общим кешем (L2).
+
+    LOCATION - алиас общего кеша SQLiteCache из CACHES. Все записи идут
+    в L2 и публикуют ключ в канал инвалидации (OPTIONS['CHANNEL'] - файл
+    SQLite), который каждый процесс читает не чаще POLL_INTERVAL секунд.
+    Поэтому чужие изменения видны в L1 с задержкой не больше
+    POLL_INTERVAL, а свои - сразу. Ключи с префиксами LOCAL_EXCLUDE
+    (блокировки, счетчики статистики) в L1 не попадают никогда.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.channel_location = options['CHANNEL']
+        self.poll_interval = float(options.get('POLL_INTERVAL', 0.5))
+        self.local_timeout = float(options.get('LOCAL_TIMEOUT', 30))
+        self.local_exclude = tuple(
+            options.get('LOCAL_EXCLUDE', ('lock:', 'cache_stats:'))
+        )
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    @property
+    def local(self):
+        # caches создает бэкенд в каждом потоке, а L1 общий на процесс.
+        key = (self.l2_alias, self.channel_location, os.getpid())
+        tier = _tiers.get(key)
+        if tier is None:
+            with _tiers_lock:
+                tier = _tiers.get(key)
+                if tier is None:
+                    tier = _tiers[key] = LocalTier(
+                        InvalidationChannel(self.channel_location)
+                    )
+        return tier
+
+    def _is_local(self, key):
+        return not key.startswith(self.local_exclude)
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _local_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _store_local(self, key, value, timeout, version):
+        self.local.set(
+            self._local_key(key, version), pickle.dumps(value),
+            timeout, self._max_entries,
+        )
+
+    def poll(self):
+        """Выбрасывает из L1 ключи, измененные другими процессами."""
+        local = self.local
+        now = time.monotonic()
+        with local.lock:
+            if now - local.last_poll < self.poll_interval:
+                return
+            expired = now - local.last_poll > CHANNEL_RETENTION
+            local.last_poll = now
+        local.last_seq, keys = local.channel.read(local.last_seq)
+        local.discard([CLEAR_ALL] if expired else keys)
+        self.flush_stats()
+
+    def flush_stats(self):
+        """Переносит счетчики попаданий процесса в общий кеш."""
+        for tier, amount in self.local.take_stats().items():
+            if not amount:
+                continue
+            key = tier_stats_key(tier)
+            try:
+                self.l2.incr(key, amount)
+            except ValueError:
+                if not self.l2.add(key, amount, None):
+                    self.l2.incr(key, amount)
+
+    def _invalidate(self, keys, version=None):
+        local_keys = [
+            self._local_key(key, version) for key in keys
+            if self._is_local(key)
+        ]
+        if local_keys:
+            self.local.discard(local_keys)
+            self.local.channel.publish(local_keys)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self.poll()
+        local = self.local
+        found = {}
+        remote = []
+        for key in keys:
+            entry = None
+            if self._is_local(key):
+                entry = local.get(self._local_key(key, version))
+            if entry is None:
+                remote.append(key)
+            else:
+                found[key] = pickle.loads(entry[0])
+        local.count('l1_hits', len(found))
+        if remote:
+            loaded = self.l2.get_many_with_expiry(remote, version=version)
+            local.count('l2_hits', len(loaded))
+            local.count('misses', len(remote) - len(loaded))
+            now = time.time()
+            for key, (value, expires) in loaded.items():
+                found[key] = value
+                if not self._is_local(key):
+                    continue
+                # В L1 не дольше, чем запись проживет в L2.
+                timeout = self.local_timeout
+                if expires is not None:
+                    timeout = min(timeout, expires - now)
+                self._store_local(key, value, timeout, version)
+        return found
+
+    def has_key(self, key, version=None):
+        return bool(self.get_many([key], version=version))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version) or []
+        self._invalidate(data, version)
+        if timeout != 0:
+            for key, value in data.items():
+                if self._is_local(key) and key not in failed:
+                    self._store_local(
+                        key, value, self._local_timeout(timeout), version
+                    )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version=version)
+        self._invalidate([key], version)
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def incr_many(self, keys, delta=1, initial=None, version=None):
+        keys = list(keys)
+        values = self.l2.incr_many(keys, delta, initial, version=version)
+        self._invalidate(keys, version)
+        return values
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+
+    def clear(self):
+        self.l2.clear()
+        self.local.discard([CLEAR_ALL])
+        self.local.channel.publish([CLEAR_ALL])
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
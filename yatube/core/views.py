@@ -1,4 +1,12 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseForbidden)
+from django.shortcuts import redirect, render
+from django.utils.crypto import constant_time_compare
+
+from . import profiling
+from . import slow_queries as slow_query_log
+from .metrics import collect, render_prometheus
 
 
 def page_not_found(request, exception):
@@ -15,3 +23,47 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=""):
     return render(request, "core/403csrf.html")
+
+
+def metrics(request):
+    """Метрики всех процессов в формате Prometheus.
+
+    Доступны персоналу или по заголовку Authorization: Bearer METRICS_TOKEN.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (request.user.is_staff or token and constant_time_compare(
+            header, f'Bearer {token}')):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def slow_queries(request):
+    """Кольцевой буфер медленных запросов; подключается через admin_view."""
+    if request.method == 'POST':
+        slow_query_log.clear()
+        return redirect('slow_queries')
+    return render(request, 'core/slow_queries.html', {
+        'title': 'Медленные запросы',
+        'entries': slow_query_log.slowest(),
+        'threshold': settings.SLOW_QUERY_THRESHOLD,
+    })
+
+
+def profiles(request):
+    """Сохраненные профили запросов; подключается через admin_view."""
+    return render(request, 'core/profiles.html', {
+        'title': 'Профили запросов',
+        'names': profiling.list_profiles(),
+        'param': settings.PROFILING_PARAM,
+    })
+
+
+def profile_download(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
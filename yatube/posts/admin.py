@@ -1,5 +1,6 @@
 from django.contrib import admin
 from posts.models import Group, Post
+from posts.search import get_index
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -15,6 +16,18 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        # Не feed(): save() объекта из only() пишет только загруженные
+        # поля и не обновил бы updated.
+        return super().get_queryset(request).select_related(
+            'author', 'group'
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return get_index().filter(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
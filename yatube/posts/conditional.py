@@ -0,0 +1,91 @@
+import hashlib
+
+from core import sharding
+from core.cache import get_generations, model_scope
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Comment, Group, Post, User
+
+
+def make_etag(request, scopes):
+    """ETag из поколений кеша: без запросов к Post и Comment.
+
+    Поколения меняются при каждой записи (см. posts.signals), а страница
+    еще зависит от пользователя (шапка, форма комментария), CSRF-токена в
+    форме и года в подвале. Без токена после входа или ротации клиент
+    получил бы 304 со старым токеном, и его следующий POST не прошел бы.
+    """
+    parts = get_generations(scopes) + [
+        request.user.pk, request.META.get('CSRF_COOKIE'),
+        timezone.now().year,
+    ]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def index_etag(request):
+    return make_etag(request, ['posts'])
+
+
+# Last-Modified не замечает удалений, поэтому главный валидатор - ETag:
+# при If-None-Match заголовок If-Modified-Since не учитывается.
+def index_last_modified(request):
+    dates = sharding.run_on_shards(
+        lambda alias: Post.objects.using(alias).aggregate(
+            last=Max('updated')
+        )['last'],
+        sharding.aliases(),
+    )
+    return max(filter(None, dates), default=None)
+
+
+def group_etag(request, slug):
+    group_id = (
+        Group.objects.filter(slug=slug).order_by()
+        .values_list('pk', flat=True).first()
+    )
+    if group_id is None:
+        return None
+    return make_etag(request, [model_scope(Group, group_id)])
+
+
+def profile_etag(request, username):
+    author_id = (
+        User.objects.filter(username=username).order_by()
+        .values_list('pk', flat=True).first()
+    )
+    if author_id is None:
+        return None
+    return make_etag(request, [model_scope(User, author_id)])
+
+
+def _post_row(request, post_id):
+    """author_id, group_id и updated поста; один запрос на оба валидатора."""
+    if not hasattr(request, '_post_validators'):
+        request._post_validators = (
+            Post.objects.located(post_id).filter(pk=post_id).order_by()
+            .values_list('author_id', 'group_id', 'updated').first()
+        )
+    return request._post_validators
+
+
+def post_detail_etag(request, post_id):
+    row = _post_row(request, post_id)
+    if row is None:
+        return None
+    author_id, group_id, _ = row
+    scopes = [model_scope(Post, post_id), model_scope(User, author_id)]
+    if group_id:
+        scopes.append(model_scope(Group, group_id))
+    return make_etag(request, scopes)
+
+
+def post_detail_last_modified(request, post_id):
+    row = _post_row(request, post_id)
+    if row is None:
+        return None
+    comments = Comment.objects.using(sharding.db_for(Comment, row[0]))
+    comment_updated = comments.filter(post_id=post_id).aggregate(
+        last=Max('updated')
+    )['last']
+    return max(filter(None, (row[2], comment_updated)))
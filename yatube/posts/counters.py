@@ -0,0 +1,80 @@
+from collections import Counter
+
+from core import sharding
+from django.db.models import Count, F
+
+from .models import Comment, Follow, Post, User, UserCounters
+
+
+def _add(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    """Атомарно сдвигает счетчик; расхождения чинит команда recount."""
+    _add(UserCounters.objects.filter(user_id=user_id), field, delta)
+
+
+def change_post(post_id, delta, using=None):
+    _add(Post.objects.using(using).filter(pk=post_id), 'comments_count', delta)
+
+
+def _grouped(queryset, key, ids):
+    rows = (
+        queryset.filter(**{f'{key}__in': ids})
+        .order_by().values(key).annotate(total=Count('pk'))
+    )
+    return {row[key]: row['total'] for row in rows}
+
+
+def recount_users(user_ids):
+    """Пересчитывает счетчики пользователей; возвращает число исправленных."""
+    user_ids = list(user_ids)
+    posts = Counter()
+    for alias in sharding.aliases():
+        posts.update(
+            _grouped(Post.objects.using(alias), 'author_id', user_ids)
+        )
+    expected = {
+        'posts_count': posts,
+        'followers_count': _grouped(Follow.objects, 'author_id', user_ids),
+        'following_count': _grouped(Follow.objects, 'user_id', user_ids),
+    }
+    existing = UserCounters.objects.in_bulk(user_ids)
+    missing = set(User.objects.filter(pk__in=user_ids).values_list(
+        'pk', flat=True
+    )) - set(existing)
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=user_id) for user_id in missing],
+        ignore_conflicts=True,
+    )
+    existing.update(UserCounters.objects.in_bulk(missing))
+    changed = []
+    for user_id, counters in existing.items():
+        drift = False
+        for field, totals in expected.items():
+            value = totals.get(user_id, 0)
+            if getattr(counters, field) != value:
+                setattr(counters, field, value)
+                drift = True
+        if drift:
+            changed.append(counters)
+    UserCounters.objects.bulk_update(changed, list(expected))
+    return len(changed)
+
+
+def recount_posts(post_ids, using=None):
+    post_ids = list(post_ids)
+    totals = _grouped(Comment.objects.using(using), 'post_id', post_ids)
+    changed = []
+    for post in Post.objects.using(using).filter(pk__in=post_ids).only(
+        'pk', 'comments_count'
+    ):
+        value = totals.get(post.pk, 0)
+        if post.comments_count != value:
+            post.comments_count = value
+            changed.append(post)
+    Post.objects.using(using).bulk_update(changed, ['comments_count'])
+    return len(changed)
@@ -1,6 +1,8 @@
 from django import forms
 
+from . import thumbnails
 from .models import Comment, Post
+from .signals import feed_scopes
 
 
 class PostForm(forms.ModelForm):
@@ -13,6 +15,14 @@ class PostForm(forms.ModelForm):
         help_texts = {'text': 'Текст нового поста',
                       'group': 'Группа с текущим постом'}
 
+    def pregenerate_thumbnails(self):
+        """Ставит миниатюры новой картинки в фоновую очередь."""
+        if 'image' in self.changed_data and self.instance.image:
+            thumbnails.schedule(
+                self.instance.image.name,
+                scopes=feed_scopes(self.instance),
+            )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,51 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import tee
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts import thumbnails
+from posts.models import Post
+from posts.signals import feed_scopes
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры для картинок существующих постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Размер пула процессов, 0 - в текущем процессе.'
+        )
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        posts = (
+            Post.objects.exclude(image='').order_by('pk')
+            .only('id', 'image', 'author', 'group')
+            .iterator(chunk_size=options['batch_size'])
+        )
+        done = 0
+        if options['workers']:
+            # map() отдает результаты по порядку, так что пост к имени
+            # файла берется из второй копии итератора.
+            posts, named = tee(posts)
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=thumbnails.MP_CONTEXT,
+                initializer=thumbnails.init_worker,
+            ) as executor:
+                names = executor.map(
+                    thumbnails.generate,
+                    (post.image.name for post in named),
+                    chunksize=options['batch_size'],
+                )
+                for post, name in zip(posts, names):
+                    thumbnails.thumbnails_ready(name, feed_scopes(post))
+                    done += 1
+        else:
+            for post in posts:
+                thumbnails.thumbnails_ready(
+                    thumbnails.generate(post.image.name), feed_scopes(post)
+                )
+                done += 1
+        self.stdout.write(f'Обработано картинок: {done}')
@@ -0,0 +1,18 @@
+from core import sharding
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        index = search.get_index()
+        for alias in sharding.aliases():
+            with transaction.atomic(using=alias):
+                index.rebuild(options['batch_size'], alias)
+        self.stdout.write(f'Индекс {type(index).__name__} пересобран')
@@ -0,0 +1,39 @@
+from core import sharding
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts import counters
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики постов и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def batches(self, queryset, batch_size):
+        last_pk = 0
+        while True:
+            ids = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return
+            yield ids
+            last_pk = ids[-1]
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed_users = fixed_posts = 0
+        for ids in self.batches(User.objects.all(), batch_size):
+            with transaction.atomic():
+                fixed_users += counters.recount_users(ids)
+        for alias in sharding.aliases():
+            for ids in self.batches(Post.objects.using(alias), batch_size):
+                with transaction.atomic(using=alias):
+                    fixed_posts += counters.recount_posts(ids, alias)
+        self.stdout.write(
+            f'Исправлено счетчиков: пользователей {fixed_users}, '
+            f'постов {fixed_posts}'
+        )
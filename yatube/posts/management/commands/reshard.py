@@ -0,0 +1,127 @@
+from core import sharding
+from core.cache import PAGE_SCOPE, bump_generation
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from posts import search
+from posts.models import Comment, Post, PostLocation, TimelineEntry
+
+CHUNK = 500
+
+
+def chunks(ids):
+    for start in range(0, len(ids), CHUNK):
+        yield ids[start:start + CHUNK]
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты и комментарии на шарды по текущему SHARDS '
+            'и заполняет PostLocation; запускать после изменения SHARDS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='sources', nargs='+',
+            help='Базы, где искать посты; по умолчанию default и SHARDS.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет перенесено.',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('SHARDS пуст: шардирование выключено.')
+        sources = options['sources'] or ['default', *settings.SHARDS]
+        for alias in sources:
+            if alias not in connections.databases:
+                raise CommandError(f'Нет базы {alias} в DATABASES.')
+        moved = 0
+        for source in dict.fromkeys(sources):
+            authors = (
+                Post.objects.using(source).order_by()
+                .values_list('author_id', flat=True).distinct()
+            )
+            for author_id in list(authors):
+                target = sharding.shard_for(author_id)
+                post_ids = list(
+                    Post.objects.using(source).filter(author_id=author_id)
+                    .order_by('pk').values_list('pk', flat=True)
+                )
+                if target != source:
+                    self.stdout.write(
+                        f'{source} -> {target}: автор {author_id}, '
+                        f'постов {len(post_ids)}'
+                    )
+                    moved += len(post_ids)
+                if options['dry_run']:
+                    continue
+                self.locate(author_id, post_ids)
+                if target != source:
+                    self.move(post_ids, source, target)
+        if moved and not options['dry_run']:
+            bump_generation(PAGE_SCOPE, 'posts')
+        self.stdout.write(f'Перенесено постов: {moved}')
+
+    @staticmethod
+    def locate(author_id, post_ids):
+        """Строки PostLocation для постов, созданных до шардирования."""
+        PostLocation.objects.bulk_create(
+            [PostLocation(pk=pk, author_id=author_id) for pk in post_ids],
+            ignore_conflicts=True,
+        )
+
+    def move(self, post_ids, source, target):
+        index = search.get_index()
+        with transaction.atomic(using=target), \
+                transaction.atomic(using=source):
+            for ids in chunks(post_ids):
+                posts = list(Post.objects.using(source).filter(pk__in=ids))
+                comments = Comment.objects.using(source).filter(
+                    post_id__in=ids
+                )
+                self.copy(Post, posts, target)
+                self.copy(Comment, comments, target)
+                for post in posts:
+                    post._state.db = target
+                    index.update(post)
+                    index.remove(post.pk, using=source)
+                for model in (TimelineEntry, Comment):
+                    self.delete(model, 'post_id', ids, source)
+                self.delete(Post, 'id', ids, source)
+
+    @staticmethod
+    def copy(model, objects, alias):
+        """INSERT OR REPLACE строк как есть: save() и bulk_create()
+        перезаписали бы auto_now и auto_now_add и вызвали бы сигналы."""
+        connection = connections[alias]
+        quote = connection.ops.quote_name
+        fields = model._meta.concrete_fields
+        columns = ', '.join(quote(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        rows = [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection)
+             for field in fields]
+            for obj in objects
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {quote(model._meta.db_table)} '
+                f'({columns}) VALUES ({placeholders})',
+                rows,
+            )
+
+    @staticmethod
+    def delete(model, column, ids, alias):
+        """Удаление без Collector: сигналы post_delete удалили бы
+        PostLocation и поправили бы счетчики перенесенных постов."""
+        connection = connections[alias]
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} '
+                f'WHERE {quote(column)} IN ({placeholders})',
+                ids,
+            )
@@ -1,5 +1,7 @@
+from core import sharding
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import F
 
 User = get_user_model()
 
@@ -13,9 +15,72 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(sharding.ShardKeyQuerySet):
+    FEED_FIELDS = (
+        'id', 'text', 'pub_date', 'image', 'author', 'group',
+        'author__id', 'author__username',
+        'author__first_name', 'author__last_name',
+        'group__id', 'group__title', 'group__slug',
+    )
+
+    SHARD_FEED_FIELDS = ('id', 'text', 'pub_date', 'image', 'author', 'group')
+
+    def feed(self):
+        if sharding.is_sharded(self.model):
+            # Авторы и группы лежат в default: JOIN на шарде невозможен.
+            return self.prefetch_related('author', 'group').only(
+                *self.SHARD_FEED_FIELDS
+            )
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+    def across_shards(self, aliases=None):
+        """Выборка со всех шардов (или aliases); без шардирования - она же."""
+        if not sharding.is_sharded(self.model):
+            return self
+        return sharding.ShardedQuerySet(self, aliases)
+
+    def located(self, post_id):
+        """Выборка на шарде поста post_id; пустая, если поста нет."""
+        if not sharding.is_sharded(self.model):
+            return self
+        author_id = (
+            PostLocation.objects.filter(pk=post_id)
+            .values_list('author_id', flat=True).first()
+        )
+        if author_id is None:
+            return self.none()
+        return self.using(sharding.shard_for(author_id))
+
+    def for_group(self, group):
+        return self.feed().filter(group=group).across_shards()
+
+    def for_author(self, author):
+        return self.feed().filter(author=author).using(
+            sharding.db_for(self.model, author.pk)
+        )
+
+    def for_follower(self, user):
+        if sharding.is_sharded(self.model):
+            # Материализованной ленты нет: посты авторов с их шардов.
+            author_ids = list(
+                Follow.objects.filter(user=user)
+                .values_list('author_id', flat=True)
+            )
+            return self.feed().filter(author_id__in=author_ids).across_shards(
+                sorted({sharding.shard_for(pk) for pk in author_ids})
+            )
+        # F(): строка '-timeline_entries__post' подставила бы сортировку
+        # Post и лишний JOIN, а индекс ленты покрывает (pub_date, post_id).
+        return self.feed().filter(timeline_entries__user=user).order_by(
+            F('timeline_entries__pub_date').desc(),
+            F('timeline_entries__post_id').desc(),
+        )
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -33,13 +98,50 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(fields=["pub_date"]),
+            models.Index(fields=["author", "pub_date"]),
+            models.Index(fields=["group", "pub_date"]),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # comments_count двигают только F()-обновления posts.counters:
+        # правка загруженного поста не должна вернуть старое значение.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name != 'comments_count'
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class PostLocation(models.Model):
+    """Автор каждого поста при шардировании, см. core.sharding.
+
+    Автоинкремент этой таблицы в default выдает постам id, единые для
+    всех шардов, а автор поста указывает шард для поиска по id.
+    """
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="+"
+    )
+
+    def __str__(self):
+        return f"Пост {self.pk} автора {self.author_id}"
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -58,9 +160,13 @@ class Comment(models.Model):
         "Дата публикации",
         auto_now_add=True
     )
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = sharding.ShardKeyQuerySet.as_manager()
 
     class Meta:
         ordering = ["-created"]
+        indexes = [models.Index(fields=["post", "created"])]
 
     def __str__(self):
         return self.text
@@ -75,3 +181,58 @@ class Follow(models.Model):
         User, on_delete=models.CASCADE,
         related_name="following"
     )
+
+    class Meta:
+        unique_together = ("user", "author")
+
+
+class UserCounters(models.Model):
+    """Денормализованные счетчики пользователя, см. posts.counters."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        primary_key=True, related_name="counters"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Счетчики {self.user_id}"
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост, разнесенный подписчику."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-pub_date", "-post_id"]
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "pub_date", "post"]),
+            models.Index(fields=["user", "author"]),
+        ]
+
+
+class SearchToken(models.Model):
+    """Обратный индекс для поиска без FTS5, см. posts.search."""
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name="search_tokens"
+    )
+    term = models.CharField(max_length=64)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [models.Index(fields=["term", "post"])]
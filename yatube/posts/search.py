@@ -0,0 +1,167 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Post, SearchToken
+
+FTS_TABLE = 'posts_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+    ]
+
+
+@lru_cache(maxsize=None)
+def fts5_supported(vendor):
+    if vendor != 'sqlite':
+        return False
+    import sqlite3
+
+    options = sqlite3.connect(':memory:').execute(
+        'PRAGMA compile_options'
+    ).fetchall()
+    return ('ENABLE_FTS5',) in options
+
+
+def use_fts5():
+    if settings.POST_SEARCH_BACKEND != 'auto':
+        return settings.POST_SEARCH_BACKEND == 'fts5'
+    return fts5_supported(connection.vendor)
+
+
+class FTS5Index:
+    """Виртуальная таблица SQLite FTS5, rowid совпадает с Post.id."""
+
+    def update(self, post):
+        connection = connections[post._state.db or DEFAULT_DB_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id, using=None):
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def rebuild(self, batch_size, using=None):
+        connection = connections[using or DEFAULT_DB_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        for batch in _post_batches(batch_size, using):
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                    batch,
+                )
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"' for term in tokenize(query))
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        # RawSQL в id__in оборачивается в лишние скобки, и SQLite
+        # сравнивает только с первой строкой подзапроса.
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            where=[f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)'],
+            params=[match],
+        )
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        return self.filter(queryset, query).annotate(rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = posts_post.id',
+            [match],
+        )).order_by('rank', '-pub_date')
+
+
+class InvertedIndex:
+    """Обратный индекс на обычной таблице SearchToken."""
+
+    def tokens(self, post_id, text):
+        return [
+            SearchToken(post_id=post_id, term=term, count=count)
+            for term, count in Counter(tokenize(text)).items()
+        ]
+
+    def update(self, post):
+        tokens = SearchToken.objects.using(post._state.db)
+        tokens.filter(post_id=post.pk).delete()
+        tokens.bulk_create(self.tokens(post.pk, post.text))
+
+    def remove(self, post_id, using=None):
+        SearchToken.objects.using(using).filter(post_id=post_id).delete()
+
+    def rebuild(self, batch_size, using=None):
+        tokens = SearchToken.objects.using(using)
+        tokens.all().delete()
+        for batch in _post_batches(batch_size, using):
+            tokens.bulk_create(
+                [token for pk, text in batch
+                 for token in self.tokens(pk, text)],
+                batch_size=batch_size,
+            )
+
+    def filter(self, queryset, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return queryset.none()
+        matching = (
+            SearchToken.objects.filter(term__in=terms)
+            .values('post_id').annotate(matched=Count('term'))
+            .filter(matched=len(terms))
+        )
+        return queryset.filter(id__in=matching.values('post_id'))
+
+    def search(self, queryset, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return queryset.none()
+        return queryset.filter(search_tokens__term__in=terms).annotate(
+            matched=Count('search_tokens'),
+            rank=Sum('search_tokens__count'),
+        ).filter(matched=len(terms)).order_by('-rank', '-pub_date')
+
+
+def _post_batches(batch_size, using=None):
+    last_pk = 0
+    while True:
+        batch = list(
+            Post.objects.using(using).filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'text')[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def get_index():
+    return FTS5Index() if use_fts5() else InvertedIndex()
+
+
+def search_posts(query, queryset=None):
+    """Посты, содержащие все слова запроса, лучшие совпадения первыми."""
+    if queryset is None:
+        queryset = Post.objects.feed()
+    return get_index().search(queryset, query).across_shards()
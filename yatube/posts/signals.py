@@ -0,0 +1,147 @@
+from core import sharding
+from core.cache import PAGE_SCOPE, bump_generation, model_scope
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, search, timeline
+from .models import (Comment, Follow, Group, Post, PostLocation, User,
+                     UserCounters)
+
+
+def feed_scopes(post):
+    scopes = [
+        'posts', model_scope(User, post.author_id), model_scope(Post, post.pk)
+    ]
+    if post.group_id:
+        scopes.append(model_scope(Group, post.group_id))
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_group(sender, instance, raw=False, using=None,
+                            **kwargs):
+    if instance.pk and not raw:
+        instance._previous_group_id = (
+            Post.objects.using(using).filter(pk=instance.pk)
+            .values_list('group_id', flat=True).first()
+        )
+
+
+@receiver(pre_save, sender=Post)
+def post_allocate_id(sender, instance, raw=False, **kwargs):
+    """На шардах id нового поста выдает PostLocation в default."""
+    if instance.pk is None and not raw and sharding.is_sharded(Post):
+        instance.pk = PostLocation.objects.create(
+            author_id=instance.author_id
+        ).pk
+
+
+@receiver(post_delete, sender=Post)
+def post_delete_location(sender, instance, **kwargs):
+    if sharding.is_sharded(Post):
+        PostLocation.objects.filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=User)
+def user_create_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_delete_sharded(sender, instance, using=None, **kwargs):
+    """Каскад удаления User идет только по базе using: посты автора и его
+    комментарии на остальных шардах удаляются здесь."""
+    if not sharding.is_sharded(Post):
+        return
+    for alias in sharding.aliases():
+        if alias != using:
+            Comment.objects.using(alias).filter(author=instance).delete()
+    shard = sharding.shard_for(instance.pk)
+    if shard != using:
+        Post.objects.using(shard).filter(author=instance).delete()
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+        counters.change_user(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_delete_counters(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def post_update_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_index().update(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_remove_search(sender, instance, **kwargs):
+    search.get_index().remove(instance.pk, using=instance._state.db)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_invalidate_feeds(sender, instance, created=False, **kwargs):
+    if not created:
+        timeline.invalidate_followers(instance.author_id)
+    scopes = feed_scopes(instance)
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id and previous_group_id != instance.group_id:
+        scopes.append(model_scope(Group, previous_group_id))
+    bump_generation(PAGE_SCOPE, *scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_invalidate_post(sender, instance, **kwargs):
+    if instance.post_id:
+        bump_generation(PAGE_SCOPE, model_scope(Post, instance.post_id))
+
+
+@receiver(post_save, sender=Comment)
+def comment_create_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        counters.change_post(instance.post_id, 1, using=instance._state.db)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_delete_counters(sender, instance, **kwargs):
+    if instance.post_id:
+        counters.change_post(instance.post_id, -1, using=instance._state.db)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_invalidate_feeds(sender, instance, **kwargs):
+    bump_generation(PAGE_SCOPE, 'posts', model_scope(Group, instance.pk))
+
+
+def follow_scopes(follow):
+    # Профиль автора показывает подписчиков, профиль подписчика - подписки.
+    return [
+        model_scope(User, follow.author_id), model_scope(User, follow.user_id)
+    ]
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+        bump_generation(PAGE_SCOPE, *follow_scopes(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_prune(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
+    bump_generation(PAGE_SCOPE, *follow_scopes(instance))
@@ -0,0 +1,28 @@
+from django import template
+from posts.utils import PAGE_ELLIPSIS, get_page_window
+
+register = template.Library()
+
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+@register.inclusion_tag('posts/includes/paginator.html', takes_context=True)
+def paginator(context, page_obj, on_each_side=2, on_ends=1):
+    window = []
+    if not getattr(page_obj, 'is_cursor', False):
+        window = get_page_window(page_obj, on_each_side, on_ends)
+    params = ''
+    request = context.get('request')
+    if request is not None:
+        query = request.GET.copy()
+        for name in PAGE_PARAMS:
+            query.pop(name, None)
+        if query:
+            params = query.urlencode() + '&'
+    return {
+        'page_obj': page_obj,
+        'page_window': window,
+        'ellipsis': PAGE_ELLIPSIS,
+        'params': params,
+    }
@@ -0,0 +1,24 @@
+import logging
+
+from django import template
+from posts.thumbnails import resolve_page
+from sorl.thumbnail.conf import settings as sorl_settings
+
+register = template.Library()
+logger = logging.getLogger(__name__)
+
+
+@register.simple_tag
+def resolve_thumbnails(posts, geometry, **options):
+    """
+    Загружает миниатюры всех постов страницы разом в post.thumbnail.
+
+    {% resolve_thumbnails page_obj "960x339" crop="center" upscale=True %}
+    """
+    try:
+        resolve_page(posts, geometry, **options)
+    except Exception:
+        if sorl_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Thumbnail resolution failed')
+    return ''
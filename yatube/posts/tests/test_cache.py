@@ -0,0 +1,373 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from core import sqlite_cache
+from core.cache import (get_or_build, get_or_revalidate, get_stats,
+                        record_lookup)
+from core.sqlite_cache import SQLiteCache, ensure_private
+from core.tiered_cache import TieredCache, tier_stats_key
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+        self.lock = threading.Lock()
+
+    def build(self):
+        with self.lock:
+            self.builds += 1
+        time.sleep(0.05)
+        return "значение"
+
+    def run_concurrently(self, fetch, workers=8):
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(fetch())
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_one_rebuild_for_concurrent_misses(self):
+        """Одновременные промахи пересчитывают значение один раз."""
+        results = self.run_concurrently(
+            lambda: get_or_build("key", self.build, 60)[0]
+        )
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(results, ["значение"] * 8)
+
+    def test_waiters_get_stale_value(self):
+        """Пока идет пересчет, остальные сразу получают старую копию."""
+        cache.set("stale", "старое")
+        results = self.run_concurrently(
+            lambda: get_or_build("key", self.build, 60, stale_key="stale")[0]
+        )
+        self.assertEqual(self.builds, 1)
+        self.assertIn("старое", results)
+        self.assertEqual(cache.get("stale"), "значение")
+
+    @override_settings(CACHE_LOCK_WAIT=0)
+    def test_rebuild_when_lock_is_stuck(self):
+        """Без копии и после ожидания вызов считает значение сам."""
+        cache.add("lock:key", "чужой", 60)
+        self.assertEqual(get_or_build("key", self.build, 60),
+                         ("значение", False))
+        self.assertEqual(cache.get("lock:key"), "чужой")
+
+    def test_benchmark_command(self):
+        """bench_stampede печатает число пересчетов для обоих режимов."""
+        out = StringIO()
+        call_command("bench_stampede", "--workers", "4", "--rounds", "1",
+                     "--build-ms", "10", stdout=out)
+        self.assertIn("single-flight: rebuilds=1 ", out.getvalue())
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.version = 0
+
+    def build(self):
+        self.version += 1
+        return self.version
+
+    def test_fresh_entry_is_not_rebuilt(self):
+        """Свежая запись отдается без пересчета."""
+        self.assertEqual(get_or_revalidate("key", self.build, 60, 60),
+                         (1, False))
+        self.assertEqual(get_or_revalidate("key", self.build, 60, 60),
+                         (1, True))
+        self.assertEqual(self.version, 1)
+
+    @override_settings(CACHE_REVALIDATE_WORKERS=0)
+    def test_stale_entry_served_then_refreshed(self):
+        """Устаревшая запись отдается как есть и обновляется."""
+        get_or_revalidate("key", self.build, 0, 60)
+        self.assertEqual(get_or_revalidate("key", self.build, 0, 60),
+                         (1, True))
+        self.assertEqual(cache.get("key")[0], 2)
+
+    def test_refresh_runs_in_background(self):
+        """Обновление выполняется в пуле потоков, а не в запросе."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return "новое"
+
+        cache.set("key", ("старое", 0), 60)
+        self.assertEqual(get_or_revalidate("key", slow_build, 60, 60),
+                         ("старое", True))
+        self.assertTrue(started.wait(5))
+        self.assertEqual(get_or_revalidate("key", slow_build, 60, 60),
+                         ("старое", True))
+        release.set()
+        for _ in range(100):
+            if cache.get("key")[0] == "новое":
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get("key")[0], "новое")
+
+    @override_settings(CACHE_REVALIDATE_WORKERS=0)
+    def test_template_tag_stale_mode(self):
+        """versioned_cache с stale= отдает старый фрагмент после срока."""
+        template = Template(
+            "{% load versioned_cache %}"
+            "{% versioned_cache 0 frag 'scope' stale=60 %}"
+            "{{ value }}{% endversioned_cache %}"
+        )
+        self.assertEqual(template.render(Context({"value": "1"})), "1")
+        self.assertEqual(template.render(Context({"value": "2"})), "1")
+        self.assertEqual(template.render(Context({"value": "3"})), "2")
+
+    def test_template_tag_renders_in_pool(self):
+        """Устаревший фрагмент перерисовывает пул по снимку контекста,
+        а запрос сразу получает старую версию."""
+        template = Template(
+            "{% load versioned_cache %}"
+            "{% versioned_cache 0 frag 'scope' stale=60 %}"
+            "{{ thread }} {{ request.get_full_path }}{% endversioned_cache %}"
+        )
+
+        def thread():
+            return threading.current_thread().name
+
+        request = RequestFactory().get("/?page=2")
+        template.render(Context({"thread": "старый", "request": request}))
+        context = Context({"thread": thread, "request": request})
+        self.assertEqual(template.render(context), "старый /?page=2")
+        for _ in range(100):
+            value = template.render(context)
+            if not value.startswith("старый"):
+                break
+            time.sleep(0.01)
+        self.assertRegex(value, r"^revalidate_\d+ /\?page=2$")
+
+
+def increment(location, times):
+    backend = SQLiteCache(location, {})
+    for _ in range(times):
+        backend.incr("counter")
+
+
+class LookupStatsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counted_in_process(self):
+        """Счетчики фрагментов пишутся в кеш пачкой, а не на каждый рендер."""
+        with mock.patch.object(cache, "incr") as incr, \
+                mock.patch.object(cache, "add") as add:
+            for hit in (True, True, False):
+                record_lookup("фрагмент", hit)
+        incr.assert_not_called()
+        add.assert_not_called()
+        self.assertEqual(
+            get_stats(["фрагмент"]), {"фрагмент": {"hits": 2, "misses": 1}}
+        )
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, "cache.sqlite3")
+        self.backend = SQLiteCache(
+            self.location,
+            {"OPTIONS": {"MAX_ENTRIES": 10, "CULL_FREQUENCY": 5}},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_basic_operations(self):
+        """get/set/add/delete и пакетные операции ведут себя как в Django."""
+        backend = self.backend
+        backend.set("a", {"значение": 1})
+        self.assertEqual(backend.get("a"), {"значение": 1})
+        self.assertFalse(backend.add("a", 2))
+        self.assertTrue(backend.add("b", 2))
+        backend.set_many({"c": 3, "d": 4})
+        self.assertEqual(backend.get_many(["b", "c", "x"]), {"b": 2, "c": 3})
+        backend.delete_many(["b", "c"])
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.incr("d", 10), 14)
+        with self.assertRaises(ValueError):
+            backend.incr("missing")
+        backend.set("expired", 1, 0)
+        self.assertFalse(backend.has_key("expired"))
+
+    def test_incr_many_in_one_transaction(self):
+        """incr_many увеличивает и заводит ключи одной транзакцией."""
+        backend = self.backend
+        backend.set("a", 1)
+        with mock.patch.object(
+            backend, "_write", wraps=backend._write
+        ) as write:
+            values = backend.incr_many(["a", "b"], initial=100)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(values, {"a": 2, "b": 100})
+        self.assertEqual(backend.get_many(["a", "b"]), {"a": 2, "b": 100})
+        self.assertEqual(backend.incr_many(["a", "c"]), {"a": 3})
+
+    def test_tests_use_temporary_file(self):
+        """Тесты не трогают общий файл кеша из CACHE_FILE."""
+        shared = settings.CACHES["shared"]["LOCATION"]
+        self.assertNotEqual(shared, settings.CACHE_FILE)
+        self.assertEqual(
+            settings.CACHES["default"]["OPTIONS"]["CHANNEL"], shared
+        )
+
+    def test_file_private(self):
+        """Файл кеша создается только для владельца, чужой отвергается."""
+        self.backend.set("a", 1)
+        self.assertEqual(os.stat(self.location).st_mode & 0o777, 0o600)
+        os.chmod(self.location, 0o666)
+        with self.assertRaises(ImproperlyConfigured):
+            ensure_private(self.location)
+        os.chmod(self.location, 0o600)
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            with self.assertRaises(ImproperlyConfigured):
+                ensure_private(self.location)
+
+    def test_shared_between_instances(self):
+        """Второй экземпляр с тем же файлом видит те же данные."""
+        self.backend.set("shared", "да")
+        other = SQLiteCache(self.location, {})
+        self.assertEqual(other.get("shared"), "да")
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет приращения."""
+        self.backend.set("counter", 0)
+        processes = [
+            multiprocessing.Process(
+                target=increment, args=(self.location, 50)
+            )
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.backend.get("counter"), 200)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читанные записи."""
+        now = time.time()
+        with mock.patch.object(sqlite_cache.time, "time") as clock:
+            for i in range(10):
+                clock.return_value = now + i
+                self.backend.set(f"key{i}", i)
+            clock.return_value = now + 20
+            self.assertEqual(self.backend.get("key0"), 0)
+            clock.return_value = now + 21
+            self.backend.set("key10", 10)
+        self.assertEqual(self.backend.get("key0"), 0)
+        self.assertIsNone(self.backend.get("key1"))
+        self.assertIsNone(self.backend.get("key2"))
+        self.assertEqual(self.backend.get("key10"), 10)
+
+    def test_benchmark_command(self):
+        """bench_cache печатает результаты для трех бэкендов."""
+        out = StringIO()
+        call_command("bench_cache", "--keys", "20", "--batch", "5",
+                     stdout=out)
+        for name in ("locmem:", "filebased:", "sqlite:"):
+            self.assertIn(name, out.getvalue())
+
+
+def write_from_other_node(backend, key, value):
+    backend.set(key, value)
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        location = os.path.join(self.directory, "cache.sqlite3")
+        self.settings_override = override_settings(CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            },
+            "l2": {
+                "BACKEND": "core.sqlite_cache.SQLiteCache",
+                "LOCATION": location,
+            },
+        })
+        self.settings_override.enable()
+        self.backend = TieredCache("l2", {"OPTIONS": {
+            "CHANNEL": location, "POLL_INTERVAL": 0,
+        }})
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_reads_served_from_l1(self):
+        """Повторное чтение не обращается к общему кешу."""
+        self.backend.set("group", "метаданные")
+        caches["l2"].delete("group")
+        self.assertEqual(self.backend.get("group"), "метаданные")
+
+    def test_other_node_write_invalidates_l1(self):
+        """Запись другого процесса выбрасывает ключ из L1."""
+        self.backend.set("name", "старое")
+        self.assertEqual(self.backend.get("name"), "старое")
+        process = multiprocessing.Process(
+            target=write_from_other_node, args=(self.backend, "name", "новое")
+        )
+        process.start()
+        process.join()
+        self.assertEqual(self.backend.get("name"), "новое")
+
+    def test_l1_respects_l2_expiry(self):
+        """Значение из L2 живет в L1 не дольше, чем в L2."""
+        caches["l2"].set("short", "значение", 0.2)
+        self.assertEqual(self.backend.get("short"), "значение")
+        time.sleep(0.3)
+        self.assertIsNone(self.backend.get("short"))
+
+    def test_channel_prune_uses_index(self):
+        """Очистка канала при записи не сканирует таблицу целиком."""
+        plan = self.backend.local.channel.connection.execute(
+            "EXPLAIN QUERY PLAN DELETE FROM cache_invalidations"
+            " WHERE created < 0"
+        ).fetchall()
+        self.assertIn("cache_invalidations_created", str(plan))
+
+    def test_excluded_keys_bypass_l1(self):
+        """Блокировки всегда читаются из общего кеша."""
+        self.backend.set("lock:key", "мой")
+        caches["l2"].set("lock:key", "чужой")
+        self.assertEqual(self.backend.get("lock:key"), "чужой")
+
+    def test_tier_stats(self):
+        """Попадания считаются отдельно для L1, L2 и промахов."""
+        self.backend.set("a", 1)
+        caches["l2"].set("b", 2)
+        self.backend.get_many(["a", "b", "c"])
+        self.backend.flush_stats()
+        tiers = ("l1_hits", "l2_hits", "misses")
+        stats = caches["l2"].get_many([tier_stats_key(t) for t in tiers])
+        self.assertEqual(
+            stats, {tier_stats_key(tier): 1 for tier in tiers}
+        )
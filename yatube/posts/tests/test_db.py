@@ -0,0 +1,170 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from core import routers
+from core.db import check_connections
+from core.management.commands.sync_replicas import Command as SyncReplicas
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class SQLiteSetupTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Новое соединение получает прагмы из SQLITE_PRAGMAS."""
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(self.pragma("busy_timeout"), 5000)
+        self.assertEqual(self.pragma("cache_size"), -20000)
+        self.assertEqual(self.pragma("temp_store"), 2)
+
+    def test_dead_connection_closed(self):
+        """Перед запросом неотвечающее соединение закрывается."""
+        closed = sqlite3.connect(":memory:")
+        closed.close()
+        dead = mock.Mock(vendor="sqlite", in_atomic_block=False,
+                         connection=closed)
+        alive = mock.Mock(vendor="sqlite", in_atomic_block=False,
+                          connection=sqlite3.connect(":memory:"))
+        with mock.patch("core.db.connections.all",
+                        return_value=[dead, alive]):
+            check_connections()
+            dead.close.assert_called_once_with()
+            alive.close.assert_not_called()
+            dead.reset_mock()
+            with override_settings(DB_HEALTH_CHECKS=False):
+                check_connections()
+            dead.close.assert_not_called()
+
+    def test_benchmark_command(self):
+        """bench_db печатает результаты для обоих режимов."""
+        out = StringIO()
+        call_command("bench_db", "--seconds", "0.2", "--posts", "20",
+                     "--readers", "1", "--writers", "1", stdout=out)
+        self.assertRegex(out.getvalue(), r"default: reads=\d+/s")
+        self.assertRegex(out.getvalue(), r"tuned: reads=\d+/s")
+
+
+# В тестах реплика - зеркало default; TransactionTestCase, чтобы данные
+# были закоммичены и видны через второе соединение.
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader")
+        self.post = Post.objects.create(author=self.user, text="Пост")
+        cache.clear()
+        routers.reset()
+        self.client = Client()
+        self.client.force_login(self.user)
+        routers.reset()
+
+    def tearDown(self):
+        routers.reset()
+
+    def replica_tables(self, send):
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            send()
+        return " ".join(query["sql"] for query in queries.captured_queries)
+
+    def test_reads_routed(self):
+        """Чтения постов идут на реплику, остальные модели - в default."""
+        self.assertEqual(Post.objects.all().db, "replica")
+        self.assertEqual(Group.objects.all().db, "replica")
+        self.assertEqual(User.objects.all().db, "default")
+        sql = self.replica_tables(
+            lambda: self.client.get(reverse("posts:index"))
+        )
+        self.assertIn("posts_post", sql)
+        self.assertNotIn("django_session", sql)
+
+    def test_write_pins_request(self):
+        """После записи поток до конца запроса читает из default."""
+        Comment.objects.create(post=self.post, author=self.user, text="К")
+        self.assertTrue(routers.wrote())
+        self.assertEqual(Comment.objects.all().db, "default")
+        routers.reset()
+        self.assertEqual(Comment.objects.all().db, "replica")
+
+    def test_other_writes_not_pinned(self):
+        """Запись сессий и пользователей не уводит чтения с реплик."""
+        response = self.client.get(reverse("posts:index"))
+        self.assertNotIn("primary_pin", response.cookies)
+        self.user.save()
+        self.assertFalse(routers.wrote())
+        self.assertEqual(Post.objects.all().db, "replica")
+        sql = self.replica_tables(lambda: Client().get(
+            reverse("posts:profile", args=(self.user.username,))
+        ))
+        self.assertIn("posts_post", sql)
+
+    def test_redirect_after_write_reads_primary(self):
+        """Страница после add_comment читается из default по cookie."""
+        response = self.client.post(
+            reverse("posts:add_comment", args=(self.post.pk,)),
+            {"text": "Комментарий"},
+        )
+        self.assertIn("primary_pin", response.cookies)
+        sql = self.replica_tables(lambda: self.client.get(response.url))
+        self.assertEqual(sql, "")
+        self.client.cookies.pop("primary_pin")
+        cache.delete(routers.RECENT_WRITE_KEY)
+        sql = self.replica_tables(lambda: self.client.get(response.url))
+        self.assertIn("posts_comment", sql)
+
+    def test_recent_write_not_cached_from_replica(self):
+        """После записи страницы других клиентов не кешируются с реплики."""
+        url = reverse("posts:post_detail", args=(self.post.pk,))
+        self.client.post(
+            reverse("posts:add_comment", args=(self.post.pk,)),
+            {"text": "Комментарий"},
+        )
+        sql = self.replica_tables(lambda: self.assertContains(
+            Client().get(url), "Комментарий"
+        ))
+        self.assertEqual(sql, "")
+
+
+class SyncReplicasTests(TestCase):
+    def test_copy(self):
+        """sync_replicas копирует базу целиком."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, "source.sqlite3")
+        target = os.path.join(directory, "target.sqlite3")
+        with sqlite3.connect(source) as source_connection:
+            source_connection.execute("CREATE TABLE t (value TEXT)")
+            source_connection.execute("INSERT INTO t VALUES ('строка')")
+        source_connection.close()
+        SyncReplicas.copy(source, target)
+        with sqlite3.connect(target) as target_connection:
+            rows = target_connection.execute("SELECT value FROM t").fetchall()
+        target_connection.close()
+        self.assertEqual(rows, [("строка",)])
+
+    def test_errors(self):
+        """Без реплик и для реплики-зеркала команда отказывается."""
+        with self.assertRaises(CommandError):
+            call_command("sync_replicas", stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("sync_replicas", "missing", stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("sync_replicas", "replica", stdout=StringIO())
@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from core import metrics, profiling, slow_queries
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post
+
+User = get_user_model()
+
+METRICS_DIR = tempfile.mkdtemp()
+PROFILING_DIR = tempfile.mkdtemp()
+
+
+@override_settings(METRICS_DIR=METRICS_DIR, METRICS_TOKEN="секрет")
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username="admin", is_staff=True)
+        Post.objects.create(author=cls.staff, text="Пост")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def value(self, text, metric, view):
+        match = re.search(
+            rf'^{metric}{{view="{re.escape(view)}"}} (\S+)$', text, re.M
+        )
+        return float(match.group(1)) if match else 0.0
+
+    def test_view_metrics_recorded(self):
+        """Для представления пишутся время, запросы, рендеринг и размер."""
+        self.client.get(reverse("posts:index"))
+        text = self.staff_client.get(reverse("metrics")).content.decode()
+        for metric in (
+            "yatube_request_duration_seconds_count",
+            "yatube_db_queries_total",
+            "yatube_template_render_seconds_total",
+            "yatube_response_bytes_total",
+        ):
+            with self.subTest(metric=metric):
+                self.assertGreater(self.value(text, metric, "posts:index"), 0)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="posts:index",'
+            'le="+Inf"}', text
+        )
+
+    def test_metrics_protected(self):
+        """/metrics закрыт для анонимов и открыт по токену."""
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer секрет")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_other_processes_aggregated(self):
+        """Сводки других процессов суммируются с текущей."""
+        before = self.value(
+            metrics.render_prometheus(metrics.collect()),
+            "yatube_db_queries_total", "posts:profile",
+        )
+        stats = metrics.new_view_stats()
+        stats.update(count=1, db_queries=7)
+        path = os.path.join(METRICS_DIR, "metrics-999999.json")
+        with open(path, "w") as snapshot_file:
+            json.dump({"posts:profile": stats}, snapshot_file)
+        after = self.value(
+            metrics.render_prometheus(metrics.collect()),
+            "yatube_db_queries_total", "posts:profile",
+        )
+        self.assertEqual(after - before, 7)
+
+
+# Порог 0 включается только внутри assertLogs: иначе журнал каждого
+# запроса попадает в вывод тестов.
+@override_settings(SLOW_QUERY_LOG_SIZE=5)
+class SlowQueryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username="dba", is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_logged(self, url):
+        with self.settings(SLOW_QUERY_THRESHOLD=0), \
+                self.assertLogs("core.slow_queries", "WARNING"):
+            return self.client.get(url)
+
+    def test_slow_query_attributed_to_view(self):
+        """Медленный запрос пишется с представлением и местом вызова."""
+        self.get_logged(reverse("posts:profile", args=(self.staff.username,)))
+        entries = slow_queries.slowest()
+        self.assertTrue(entries)
+        self.assertLessEqual(len(entries), 5)
+        self.assertIn("posts:profile", {e["view"] for e in entries})
+        self.assertIn("posts/views.py:profile",
+                      {e["call_site"] for e in entries})
+
+    @override_settings(SLOW_QUERY_THRESHOLD=60)
+    def test_fast_queries_not_logged(self):
+        """Быстрые запросы в буфер не попадают."""
+        self.client.get(reverse("posts:index"))
+        self.assertEqual(slow_queries.slowest(), [])
+
+    def test_admin_page(self):
+        """Буфер виден персоналу в админке."""
+        self.get_logged(reverse("posts:index"))
+        User.objects.filter(pk=self.staff.pk).update(is_superuser=True)
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get(reverse("slow_queries"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "SELECT")
+        self.assertEqual(
+            self.client.get(reverse("slow_queries")).status_code, 302
+        )
+
+
+@override_settings(PROFILING_DIR=PROFILING_DIR, PROFILING_RELEASE="v1.2")
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(
+            username="perf", is_staff=True, is_superuser=True
+        )
+        cls.post = Post.objects.create(author=cls.staff, text="Пост")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(PROFILING_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+        self.url = reverse("posts:post_detail", args=(self.post.pk,))
+
+    def test_report_returned(self):
+        """С ?_profile=show персонал получает отчет вместо страницы."""
+        response = self.staff_client.get(self.url, {"_profile": "show"})
+        report = response.content.decode()
+        self.assertEqual(response["Content-Type"],
+                         "text/plain; charset=utf-8")
+        self.assertIn("view: posts:post_detail", report)
+        self.assertIn("release: v1.2", report)
+        self.assertRegex(report, r"db: [1-9]\d* queries")
+        self.assertIn("templates: ", report)
+        self.assertIn("cumulative", report)
+
+    def test_profile_stored_and_downloadable(self):
+        """Заголовок X-Profile сохраняет профиль, доступный в админке."""
+        response = self.staff_client.get(self.url, HTTP_X_PROFILE="1")
+        self.assertContains(response, self.post.text)
+        name = response["X-Profile-Id"]
+        self.assertIn("_v1.2_posts-post_detail_", name)
+        self.assertIn(f"{name}.prof", profiling.list_profiles())
+        listing = self.staff_client.get(reverse("profiles"))
+        self.assertContains(listing, f"{name}.txt")
+        download = self.staff_client.get(
+            reverse("profile_download", args=(f"{name}.prof",))
+        )
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b"".join(download.streaming_content))
+        self.assertEqual(
+            self.staff_client.get(
+                reverse("profile_download", args=("missing.prof",))
+            ).status_code, 404
+        )
+
+    def test_only_staff_profiled(self):
+        """Параметр от обычного посетителя игнорируется."""
+        response = self.client.get(self.url, {"_profile": "show"})
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        self.assertTemplateUsed(response, "posts/post_detail.html")
+        self.assertEqual(
+            self.client.get(reverse("profiles")).status_code, 302
+        )
@@ -0,0 +1,85 @@
+from core.nplusone import NPlusOneError, detect_nplusone, normalize
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class NormalizeTests(TestCase):
+    def test_literals_and_in_lists_collapse(self):
+        """Запросы с разными литералами и списками IN имеют одну форму."""
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+            normalize("SELECT *  FROM t WHERE id = 25 AND name = 'b''c'"),
+        )
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id IN (%s, %s)"),
+            normalize("SELECT * FROM t WHERE id IN (%s, %s, %s)"),
+        )
+
+
+@override_settings(NPLUSONE_ENABLED=True, NPLUSONE_RAISE=True,
+                   NPLUSONE_THRESHOLD=3)
+class NPlusOneTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title="Группа", slug="n1-slug", description="Описание"
+        )
+        cls.reader = User.objects.create_user(username="reader")
+        cls.authors = [
+            User.objects.create_user(username=f"author{i}") for i in range(6)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                author=author, text="Пост", group=cls.group
+            )
+        cls.post = post
+        for author in cls.authors:
+            Comment.objects.create(post=post, author=author, text="Ок")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_pages_have_no_nplusone(self):
+        """Ленты и страница поста не делают запросов на каждую строку."""
+        for url in (
+            reverse("posts:index"),
+            reverse("posts:group_list", args=(self.group.slug,)),
+            reverse("posts:profile", args=(self.authors[0].username,)),
+            reverse("posts:post_detail", args=(self.post.id,)),
+            reverse("posts:follow_index"),
+            reverse("posts:search") + "?q=Пост",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_template_line_reported(self):
+        """Ошибка указывает шаблон и строку, где повторяется запрос."""
+        template = Template(
+            "{% for comment in comments %}\n"
+            "{{ comment.author.username }}\n"
+            "{% endfor %}"
+        )
+        comments = Comment.objects.filter(post=self.post)
+        with self.assertRaisesMessage(NPlusOneError, "<unknown source>:2"):
+            with detect_nplusone():
+                template.render(Context({"comments": comments}))
+
+    def test_warning_mode_logs(self):
+        """Без raise_errors находки попадают в лог."""
+        with self.assertLogs("core.nplusone", "WARNING") as logs:
+            with detect_nplusone(raise_errors=False) as detector:
+                for comment in Comment.objects.filter(post=self.post):
+                    comment.author.username
+            detector.finish("posts:post_detail")
+        self.assertIn("posts/tests/test_nplusone.py", logs.output[0])
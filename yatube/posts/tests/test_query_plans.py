@@ -0,0 +1,151 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# 'SCAN posts_post' без USING INDEX - полный проход по таблице.
+FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS \S+)?$")
+SKIPPED_STATEMENTS = ("SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN", "COMMIT")
+
+# Чего индекс дать не может: порядок поиска зависит от релевантности
+# (bm25 или число совпавших слов), а форма поста выводит все группы.
+ALLOWED = {
+    "posts:search": {"USE TEMP B-TREE FOR ORDER BY"},
+    "posts:post_create": {"SCAN posts_group"},
+    "posts:post_edit": {"SCAN posts_group"},
+}
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """Полные проходы по таблицам и временные B-деревья в плане."""
+    derived = {
+        detail.split(" ", 1)[1] for detail in plan
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    problems = []
+    for detail in plan:
+        match = FULL_SCAN_RE.match(detail)
+        if match and match.group(1) not in derived:
+            problems.append(detail)
+        elif "TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+class QueryPlanTests(TestCase):
+    """Запросы всех представлений posts идут по индексам.
+
+    Каждая страница открывается на заполненной базе, а для каждого ее
+    запроса выполняется EXPLAIN QUERY PLAN.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.author = User.objects.create_user(username="author")
+        cls.other = User.objects.create_user(username="other")
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(30):
+            post = Post.objects.create(
+                author=cls.author if number % 2 else cls.other,
+                group=cls.group if number % 3 else None,
+                text=f"Пост номер {number}",
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f"Комментарий {number}"
+            )
+        cls.post = post
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.post.author)
+
+    def assert_plans_use_indexes(self, view_name, send):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            send()
+        self.assertTrue(queries.captured_queries)
+        allowed = ALLOWED.get(view_name, set())
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if sql.startswith(SKIPPED_STATEMENTS):
+                continue
+            problems = set(plan_problems(explain(sql))) - allowed
+            self.assertFalse(problems, f"{view_name}: {sql}")
+
+    def test_read_views(self):
+        """Страницы читают данные без полных проходов и сортировок."""
+        post_id = self.post.pk
+        pages = {
+            "posts:index": reverse("posts:index"),
+            "posts:index?page": reverse("posts:index") + "?page=2",
+            "posts:group_list": reverse(
+                "posts:group_list", args=(self.group.slug,)
+            ),
+            "posts:profile": reverse(
+                "posts:profile", args=(self.author.username,)
+            ),
+            "posts:post_detail": reverse(
+                "posts:post_detail", args=(post_id,)
+            ),
+            "posts:follow_index": reverse("posts:follow_index"),
+            "posts:search": reverse("posts:search") + "?q=пост",
+            "posts:post_create": reverse("posts:post_create"),
+        }
+        for view_name, url in pages.items():
+            with self.subTest(view=view_name):
+                self.assert_plans_use_indexes(
+                    view_name.split("?")[0], lambda: self.client.get(url)
+                )
+        with self.subTest(view="posts:post_edit"):
+            self.assert_plans_use_indexes(
+                "posts:post_edit",
+                lambda: self.author_client.get(
+                    reverse("posts:post_edit", args=(post_id,))
+                ),
+            )
+
+    def test_write_views(self):
+        """Записи и их сигналы (ленты, счетчики, поиск) идут по индексам."""
+        actions = {
+            "posts:post_create": lambda: self.author_client.post(
+                reverse("posts:post_create"), {"text": "Новый пост"}
+            ),
+            "posts:post_edit": lambda: self.author_client.post(
+                reverse("posts:post_edit", args=(self.post.pk,)),
+                {"text": "Исправленный пост"},
+            ),
+            "posts:add_comment": lambda: self.client.post(
+                reverse("posts:add_comment", args=(self.post.pk,)),
+                {"text": "Комментарий"},
+            ),
+            "posts:profile_unfollow": lambda: self.client.get(
+                reverse("posts:profile_unfollow", args=("author",))
+            ),
+            "posts:profile_follow": lambda: self.client.get(
+                reverse("posts:profile_follow", args=("author",))
+            ),
+        }
+        for view_name, send in actions.items():
+            with self.subTest(view=view_name):
+                self.assert_plans_use_indexes(view_name, send)
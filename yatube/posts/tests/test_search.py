@@ -0,0 +1,73 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post, SearchToken
+from ..search import FTS5Index, InvertedIndex, search_posts
+
+User = get_user_model()
+
+
+class SearchMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Кошки любят молоко. Кошки спят.'
+        )
+        cls.dogs = Post.objects.create(
+            author=cls.user, text='Собаки любят кошки-мышки'
+        )
+        cls.other = Post.objects.create(author=cls.user, text='Погода')
+
+    def test_search_ranks_all_terms(self):
+        """Находятся посты со всеми словами, частые совпадения выше."""
+        self.assertEqual(list(search_posts('кошки')), [self.cats, self.dogs])
+        self.assertEqual(list(search_posts('любят молоко')), [self.cats])
+        self.assertEqual(list(search_posts('!!!')), [])
+
+    def test_index_follows_writes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        self.other.text = 'Кошки на солнце'
+        self.other.save()
+        self.assertIn(self.other, search_posts('солнце'))
+        self.other.delete()
+        self.assertEqual(list(search_posts('солнце')), [])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search_index индексирует bulk_create."""
+        Post.objects.bulk_create([Post(author=self.user, text='Жирафы')])
+        self.assertEqual(list(search_posts('жирафы')), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(search_posts('жирафы')), 1)
+
+    def test_search_view_and_admin(self):
+        """Страница поиска и поиск в админке используют индекс."""
+        response = Client().get(reverse('posts:search'), {'q': 'молоко'})
+        self.assertEqual(list(response.context['page_obj']), [self.cats])
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        response = client.get('/admin/posts/post/', {'q': 'собаки'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.dogs]
+        )
+
+
+@override_settings(POST_SEARCH_BACKEND='fts5')
+class FTS5SearchTests(SearchMixin, TestCase):
+    def test_backend(self):
+        from ..search import get_index
+        self.assertIsInstance(get_index(), FTS5Index)
+
+
+@override_settings(POST_SEARCH_BACKEND='inverted')
+class InvertedSearchTests(SearchMixin, TestCase):
+    def test_backend(self):
+        from ..search import get_index
+        self.assertIsInstance(get_index(), InvertedIndex)
+        self.assertTrue(SearchToken.objects.filter(post=self.cats))
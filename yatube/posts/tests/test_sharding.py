@@ -0,0 +1,228 @@
+from io import StringIO
+from unittest import mock
+
+from core import sharding
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, PostLocation
+from ..search import search_posts
+
+User = get_user_model()
+SHARDS = ["default", "shard1"]
+
+
+def sql(alias, send):
+    with CaptureQueriesContext(connections[alias]) as queries:
+        send()
+    return " ".join(query["sql"] for query in queries.captured_queries)
+
+
+# TransactionTestCase: шарды - отдельные базы, данные должны быть
+# закоммичены, иначе их не видят соединения других потоков.
+@override_settings(SHARDS=SHARDS, SHARD_WORKERS=4)
+class ShardingTests(TransactionTestCase):
+    databases = {"default", "shard1"}
+
+    def setUp(self):
+        cache.clear()
+        self.authors = {}
+        number = 0
+        while len(self.authors) < len(SHARDS):
+            user = User.objects.create_user(username=f"author{number}")
+            self.authors.setdefault(sharding.shard_for(user.pk), user)
+            number += 1
+        self.local = self.authors["default"]
+        self.remote = self.authors["shard1"]
+        self.reader = User.objects.create_user(username="reader")
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_shard_for(self):
+        """Шард ключа стабилен и всегда из списка."""
+        self.assertEqual(sharding.shard_for(42), sharding.shard_for("42"))
+        self.assertIn(sharding.shard_for(42), SHARDS)
+        with override_settings(SHARDS=[]):
+            self.assertFalse(sharding.is_sharded(Post))
+            self.assertIsNone(sharding.db_for(Post, 42))
+
+    def test_post_placement(self):
+        """Пост и комментарии пишутся на шард автора, id выдает default."""
+        post = Post.objects.create(author=self.remote, text="Удаленный")
+        self.assertEqual(post._state.db, "shard1")
+        self.assertFalse(Post.objects.using("default").filter(pk=post.pk))
+        self.assertEqual(
+            PostLocation.objects.get(pk=post.pk).author_id, self.remote.pk
+        )
+        self.assertEqual(Post.objects.located(post.pk).get(pk=post.pk), post)
+        Comment.objects.create(post=post, author=self.reader, text="К")
+        self.assertEqual(Comment.objects.using("shard1").count(), 1)
+        with self.assertRaises(ValueError):
+            Comment.objects.create(
+                post_id=post.pk, author=self.reader, text="Без поста"
+            )
+        self.assertFalse(Comment.objects.using("default").exists())
+        post = Post.objects.located(post.pk).get(pk=post.pk)
+        self.assertEqual(post.comments_count, 1)
+        self.assertFalse(Post.objects.located(post.pk + 1000).exists())
+        post.delete()
+        self.assertFalse(PostLocation.objects.filter(pk=post.pk).exists())
+
+    def test_ids_unique_across_shards(self):
+        """Посты разных шардов не получают одинаковых id."""
+        ids = [
+            Post.objects.create(author=author, text="Пост").pk
+            for author in (self.local, self.remote, self.local, self.remote)
+        ]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_profile_reads_one_shard(self):
+        """Профиль читает посты только с шарда автора."""
+        Post.objects.create(author=self.remote, text="Удаленный")
+        url = reverse("posts:profile", args=(self.remote.username,))
+        default_sql = sql("default", lambda: self.assertContains(
+            self.client.get(url), "Удаленный"
+        ))
+        self.assertNotIn("posts_post", default_sql)
+        shard_sql = sql("shard1", lambda: self.client.get(url))
+        self.assertIn("posts_post", shard_sql)
+
+    def test_index_merges_shards(self):
+        """Главная сливает шарды по дате и листается постранично."""
+        posts = [
+            Post.objects.create(
+                author=self.local if i % 3 else self.remote, text=f"Пост {i}"
+            )
+            for i in range(13)
+        ]
+        expected = posts[::-1]
+        merged = Post.objects.feed().across_shards()
+        self.assertEqual(merged.count(), 13)
+        self.assertEqual(list(merged), expected)
+        self.assertEqual(merged[3:7], expected[3:7])
+        response = self.client.get(reverse("posts:index") + "?page=2")
+        self.assertEqual(
+            list(response.context["page_obj"]), expected[10:]
+        )
+        self.assertEqual(response.context["page_obj"][0].author.pk,
+                         expected[10].author_id)
+
+    def test_cursor_pagination(self):
+        """Курсорная выборка работает и на шардах."""
+        for i in range(12):
+            Post.objects.create(
+                author=self.local if i % 2 else self.remote, text=f"П {i}"
+            )
+        expected = list(Post.objects.across_shards())
+        with self.settings(CURSOR_PAGINATION_VIEWS=("posts:index",)):
+            first = self.client.get(reverse("posts:index"))
+            page = first.context["page_obj"]
+            second = self.client.get(
+                reverse("posts:index") + f"?after={page.next_cursor}"
+            )
+        self.assertEqual(list(page), expected[:10])
+        self.assertEqual(list(second.context["page_obj"]), expected[10:])
+
+    def test_follow_feed(self):
+        """Лента подписок собирается с шардов авторов."""
+        Follow.objects.create(user=self.reader, author=self.local)
+        Follow.objects.create(user=self.reader, author=self.remote)
+        first = Post.objects.create(author=self.local, text="Локальный")
+        second = Post.objects.create(author=self.remote, text="Удаленный")
+        Post.objects.create(author=self.reader, text="Свой")
+        response = self.client.get(reverse("posts:follow_index"))
+        self.assertEqual(
+            list(response.context["page_obj"]), [second, first]
+        )
+
+    def test_post_detail_and_comment(self):
+        """Страница поста и добавление комментария на шарде автора."""
+        post = Post.objects.create(author=self.remote, text="Удаленный")
+        self.client.post(
+            reverse("posts:add_comment", args=(post.pk,)),
+            {"text": "Комментарий"},
+        )
+        response = self.client.get(
+            reverse("posts:post_detail", args=(post.pk,))
+        )
+        self.assertContains(response, "Комментарий")
+        self.assertEqual(response.context["post"].author, self.remote)
+        self.assertEqual(
+            self.client.get(
+                reverse("posts:post_detail", args=(post.pk + 1000,))
+            ).status_code,
+            404,
+        )
+
+    def test_search_across_shards(self):
+        """Поиск находит посты на всех шардах."""
+        Post.objects.create(author=self.local, text="редкое слово")
+        Post.objects.create(author=self.remote, text="редкое слово тоже")
+        self.assertEqual(len(list(search_posts("редкое"))), 2)
+
+    def test_user_delete_cleans_shards(self):
+        """Удаление пользователя убирает его посты и комментарии с шардов."""
+        local = Post.objects.create(author=self.local, text="Локальный")
+        remote = Post.objects.create(author=self.remote, text="Удаленный")
+        Comment.objects.create(post=remote, author=self.local, text="К")
+        Comment.objects.create(post=local, author=self.remote, text="К")
+        self.local.delete()
+        self.assertFalse(Comment.objects.using("shard1").exists())
+        self.assertEqual(
+            Post.objects.located(remote.pk).get(pk=remote.pk).comments_count,
+            0,
+        )
+        self.remote.delete()
+        self.assertFalse(Post.objects.across_shards().count())
+        self.assertFalse(PostLocation.objects.exists())
+        self.assertEqual(
+            self.client.get(reverse("posts:index")).status_code, 200
+        )
+
+    def test_pool_threads_close_old_connections(self):
+        """Потоки пула закрывают устаревшие соединения до и после задачи."""
+        with mock.patch("core.sharding.close_old_connections") as close:
+            sharding.run_on_shards(
+                lambda alias: Post.objects.using(alias).count(), SHARDS
+            )
+        self.assertEqual(close.call_count, 2 * len(SHARDS))
+
+    def test_reshard(self):
+        """reshard переносит посты с комментариями на шард автора."""
+        with override_settings(SHARDS=[]):
+            local = Post.objects.create(author=self.local, text="здесь")
+            remote = Post.objects.create(author=self.remote, text="туда")
+            Comment.objects.create(post=remote, author=self.reader, text="К")
+        created = Post.objects.using("default").get(pk=remote.pk).pub_date
+        out = StringIO()
+        call_command("reshard", "--dry-run", stdout=out)
+        self.assertIn("default -> shard1", out.getvalue())
+        self.assertFalse(Post.objects.using("shard1").exists())
+        call_command("reshard", stdout=StringIO())
+        self.assertEqual(
+            list(Post.objects.using("default").values_list("pk", flat=True)),
+            [local.pk],
+        )
+        moved = Post.objects.located(remote.pk).get(pk=remote.pk)
+        self.assertEqual(moved._state.db, "shard1")
+        self.assertEqual(moved.pub_date, created)
+        self.assertEqual(moved.comments_count, 1)
+        self.assertEqual(Comment.objects.using("shard1").count(), 1)
+        self.assertFalse(Comment.objects.using("default").exists())
+        self.assertEqual(PostLocation.objects.count(), 2)
+        self.assertEqual(list(search_posts("туда")), [moved])
+        new = Post.objects.create(author=self.remote, text="Новый")
+        self.assertGreater(new.pk, remote.pk)
+
+    def test_reshard_errors(self):
+        """Без SHARDS и с неизвестной базой reshard отказывается."""
+        with override_settings(SHARDS=[]):
+            with self.assertRaises(CommandError):
+                call_command("reshard", stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("reshard", "--from", "missing", stdout=StringIO())
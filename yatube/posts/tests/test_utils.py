@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post
+from ..utils import (PAGE_ELLIPSIS, CursorPaginator, decode_cursor,
+                     encode_cursor, get_page_window)
+
+User = get_user_model()
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cursor')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {i}') for i in range(25)
+        )
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_roundtrip(self):
+        """Токен курсора декодируется обратно в (pub_date, id)."""
+        post = self.ordered[0]
+        self.assertEqual(
+            decode_cursor(encode_cursor(post)), (post.pub_date, post.pk)
+        )
+        self.assertIsNone(decode_cursor('мусор'))
+
+    def test_pages_forward_and_back(self):
+        """Курсор листает вперед и назад без пропусков и повторов."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page()
+        second = paginator.get_page(after=first.next_cursor)
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third),
+                         self.ordered)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+        self.assertEqual(len(third), 5)
+        back = paginator.get_page(before=third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertTrue(back.has_previous())
+        self.assertEqual(
+            list(paginator.get_page(before=back.previous_cursor)),
+            list(first)
+        )
+
+    def test_page_is_constant_number_of_queries(self):
+        """Страница по курсору выполняется одним запросом без COUNT."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        cursor = encode_cursor(self.ordered[14])
+        with self.assertNumQueries(1):
+            page = paginator.get_page(after=cursor)
+            self.assertEqual(list(page), self.ordered[15:25])
+
+    @override_settings(CURSOR_PAGINATION_VIEWS=('posts:index',))
+    def test_view_uses_cursor_when_selected(self):
+        """Представление из CURSOR_PAGINATION_VIEWS отдает ссылки ?after=."""
+        response = Client().get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertTrue(page.is_cursor)
+        self.assertContains(response, f'?after={page.next_cursor}')
+
+
+class PageWindowTests(TestCase):
+    def window(self, number, count=1000):
+        page = Paginator(range(count), 1).get_page(number)
+        return get_page_window(page)
+
+    def test_small_range_is_not_elided(self):
+        """Если страниц мало, выводятся все номера."""
+        self.assertEqual(self.window(3, count=7), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_window_is_bounded(self):
+        """Окно вокруг текущей страницы с краями и пропусками."""
+        e = PAGE_ELLIPSIS
+        self.assertEqual(self.window(1), [1, 2, 3, e, 1000])
+        self.assertEqual(self.window(500),
+                         [1, e, 498, 499, 500, 501, 502, e, 1000])
+        self.assertEqual(self.window(1000), [1, e, 998, 999, 1000])
+        self.assertEqual(self.window(4), [1, 2, 3, 4, 5, 6, e, 1000])
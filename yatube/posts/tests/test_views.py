@@ -1,15 +1,31 @@
 import shutil
 import tempfile
-
+from concurrent.futures import Future
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from core.auth import user_key
+from core.cache import get_stats
 from django import forms
+from django.apps import apps as global_apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Comment, Follow, Group, Post
+from .. import thumbnails
+from ..models import (Comment, Follow, Group, Post, TimelineEntry,
+                      UserCounters)
+from ..signals import feed_scopes
 
 User = get_user_model()
 
@@ -190,13 +206,39 @@ class PostPagesTests(TestCase):
     def test_check_cache(self):
         """Проверка кеша."""
         response = self.guest_client.get(reverse("posts:index"))
-        Post.objects.get(id=self.post.id).delete()
+        Post.objects.filter(id=self.post.id).update(text="Без сигнала")
         response2 = self.guest_client.get(reverse("posts:index"))
         self.assertEqual(response.content, response2.content)
         cache.clear()
         response3 = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response3.content)
 
+    def test_cache_invalidated_on_write(self):
+        """Изменение поста сразу сбрасывает кеш затронутых лент."""
+        pages = (
+            reverse("posts:index"),
+            reverse("posts:group_list", kwargs={"slug": self.group.slug}),
+            reverse("posts:profile", kwargs={"username": self.user}),
+        )
+        for page in pages:
+            self.guest_client.get(page)
+        post = Post.objects.get(id=self.post.id)
+        post.text = "Обновленный текст"
+        post.save()
+        for page in pages:
+            with self.subTest(page=page):
+                response = self.guest_client.get(page)
+                self.assertContains(response, "Обновленный текст")
+
+    def test_cache_invalidated_for_previous_group(self):
+        """Перенос поста в другую группу сбрасывает кеш старой группы."""
+        page = reverse("posts:group_list", kwargs={"slug": self.group.slug})
+        self.assertContains(self.guest_client.get(page), self.post.text)
+        post = Post.objects.get(id=self.post.id)
+        post.group = self.group2
+        post.save()
+        self.assertNotContains(self.guest_client.get(page), self.post.text)
+
     def test_author_subscription(self):
         """Проверка подписки на автора поста"""
         sub_1 = Follow.objects.filter(
@@ -310,3 +352,618 @@ class TaskPagesTests(TestCase):
         )
         obj = response.context["post"]
         self.assertEqual(obj.image, self.post.image)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.author = User.objects.create_user(username="writer")
+        cls.old_post = Post.objects.create(author=cls.author, text="Старый")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse("posts:follow_index"))
+        return list(response.context["page_obj"])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка заполняет ленту, отписка ее очищает."""
+        self.client.get(
+            reverse("posts:profile_follow", args=(self.author.username,))
+        )
+        self.assertEqual(self.feed(), [self.old_post])
+        self.client.get(
+            reverse("posts:profile_unfollow", args=(self.author.username,))
+        )
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(self.feed(), [])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленту подписчика первым."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text="Новый")
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_timeline_is_capped(self):
+        """Лента не растет больше TIMELINE_MAX_LENGTH."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f"Пост {i}")
+            for i in range(3)
+        ]
+        self.assertEqual(self.feed(), posts[:0:-1])
+
+    def test_fan_out_bumps_in_one_write(self):
+        """Ленты всех подписчиков сбрасываются одной записью в кеш."""
+        for i in range(5):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f"fan{i}"),
+                author=self.author,
+            )
+        with mock.patch.object(
+            cache, "incr_many", wraps=cache.incr_many
+        ) as incr_many, mock.patch.object(cache, "incr") as incr:
+            Post.objects.create(author=self.author, text="Новый")
+        incr.assert_not_called()
+        timelines = [
+            [key for key in call[0][0] if key.startswith("generation:timel")]
+            for call in incr_many.call_args_list
+        ]
+        self.assertIn(5, [len(keys) for keys in timelines])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_fan_out_trims_in_one_statement(self):
+        """Обрезка лент при новом посте не зависит от числа подписчиков."""
+        followers = [
+            User.objects.create_user(username=f"fan{i}") for i in range(5)
+        ]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f"Пост {i}")
+            for i in range(2)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            newest = Post.objects.create(author=self.author, text="Новый")
+        deletes = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('DELETE FROM "posts_timelineentry"')
+        ]
+        self.assertEqual(len(deletes), 1)
+        for follower in followers:
+            self.assertEqual(
+                list(TimelineEntry.objects.filter(user=follower)
+                     .values_list("post_id", flat=True)),
+                [newest.pk, posts[1].pk],
+            )
+
+    def test_follow_page_cache_is_per_user(self):
+        """Кеш ленты подписок не делится между пользователями."""
+        other = User.objects.create_user(username="other_reader")
+        other_client = Client()
+        other_client.force_login(other)
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse("posts:follow_index")
+        self.assertContains(self.client.get(url), self.old_post.text)
+        self.assertNotContains(other_client.get(url), self.old_post.text)
+
+    def test_follow_page_cache_invalidated(self):
+        """Публикация и правка автора сразу видны в кешированной ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse("posts:follow_index")
+        self.client.get(url)
+        post = Post.objects.create(author=self.author, text="Свежий пост")
+        self.assertContains(self.client.get(url), post.text)
+        post.text = "Исправленный пост"
+        post.save()
+        self.assertContains(self.client.get(url), post.text)
+
+    def test_follow_page_cache_stats(self):
+        """Попадания и промахи кеша ленты подписок считаются."""
+        url = reverse("posts:follow_index")
+        before = get_stats(["follow_page"])["follow_page"]
+        self.client.get(url)
+        self.client.get(url)
+        stats = get_stats(["follow_page"])["follow_page"]
+        self.assertEqual(
+            {outcome: stats[outcome] - before[outcome] for outcome in stats},
+            {"hits": 1, "misses": 1},
+        )
+
+    def test_rebuild_command_restores_timeline(self):
+        """Команда rebuild_timelines восстанавливает потерянные записи."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertEqual(self.feed(), [self.old_post])
+
+
+class FeedQueryCountTests(TestCase):
+    """Число запросов на странице ленты не зависит от числа постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="counter")
+        cls.group = Group.objects.create(
+            title="Группа", slug="count-slug", description="Описание"
+        )
+        cls.authors = [
+            User.objects.create_user(username=f"author{i}",
+                                     first_name="Имя", last_name="Фамилия")
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(15):
+            Post.objects.create(
+                author=cls.authors[i % 3], text=f"Пост {i}", group=cls.group
+            )
+        cls.post = Post.objects.latest("id")
+        for author in cls.authors:
+            Comment.objects.create(post=cls.post, author=author, text="Ок")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_feed_query_count(self):
+        """Каждая лента выполняет фиксированное число запросов."""
+        pages = (
+            (reverse("posts:index"), 3),
+            (reverse("posts:group_list", args=(self.group.slug,)), 4),
+            (reverse("posts:profile", args=(self.authors[0].username,)), 4),
+            (reverse("posts:post_detail", args=(self.post.id,)), 4),
+        )
+        for url, queries in pages:
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+
+    def test_follow_feed_query_count(self):
+        """Лента подписок выполняет фиксированное число запросов."""
+        self.client.force_login(self.reader)
+        self.client.get(reverse("posts:follow_index"))
+        cache.clear()
+        with self.assertNumQueries(4):
+            self.client.get(reverse("posts:follow_index"))
+
+
+class SessionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="reader", password="p")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def warm_queries(self, user=None):
+        self.client.force_login(user or self.user)
+        self.client.get(reverse("posts:follow_index"))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("posts:follow_index"))
+        return len(context.captured_queries)
+
+    def test_session_and_user_cached(self):
+        """Сессия и пользователь из кеша экономят два запроса."""
+        uncached = {
+            "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+            "AUTHENTICATION_BACKENDS": [
+                "django.contrib.auth.backends.ModelBackend"
+            ],
+        }
+        with self.settings(**uncached):
+            before = self.warm_queries()
+        self.client = Client()
+        self.assertEqual(self.warm_queries(), before - 2)
+
+    def test_old_backend_sessions_kept(self):
+        """Миграция переводит сессии ModelBackend на CachedModelBackend."""
+        self.client.force_login(
+            self.user, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        url = reverse("posts:follow_index")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        session_backend = import_module(
+            "core.migrations.0001_session_backend"
+        )
+        session_backend.move_sessions(
+            global_apps, SimpleNamespace(connection=connection)
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_password_hash_not_cached(self):
+        """В кеше пользователя нет хеша пароля."""
+        self.warm_queries()
+        cached = cache.get(user_key(self.user.pk))
+        self.assertNotIn("password", cached)
+        self.assertNotIn(self.user.password, str(cached))
+
+    def test_password_change_logs_out_other_sessions(self):
+        """Смена пароля сбрасывает кешированного пользователя."""
+        other = Client()
+        other.force_login(self.user)
+        self.warm_queries()
+        other.post(reverse("users:password_change"), {
+            "old_password": "p",
+            "new_password1": "Другой-пароль-42",
+            "new_password2": "Другой-пароль-42",
+        })
+        response = self.client.get(reverse("posts:follow_index"))
+        self.assertRedirects(
+            response,
+            reverse("users:login") + "?next=" + reverse("posts:follow_index"),
+        )
+        self.assertEqual(
+            other.get(reverse("posts:follow_index")).status_code, 200
+        )
+
+    def test_deleted_user_logged_out(self):
+        """Удаленный пользователь не остается в кеше."""
+        user = User.objects.create_user(username="leaving")
+        self.warm_queries(user)
+        user.delete()
+        self.assertRedirects(
+            self.client.get(reverse("posts:follow_index")),
+            reverse("users:login") + "?next=" + reverse("posts:follow_index"),
+        )
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="counted")
+        cls.reader = User.objects.create_user(username="counting")
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text="Пост")
+        Comment.objects.create(post=post, author=self.reader, text="Ок")
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        follow.delete()
+        post.comments.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+        post.delete()
+        self.assertEqual(self.counters(self.author).posts_count, 0)
+
+    def test_edit_keeps_concurrent_comment_count(self):
+        """Правка поста не затирает счетчик, сдвинутый комментарием."""
+        post = Post.objects.create(author=self.author, text="Пост")
+        client = Client()
+        client.force_login(self.author)
+        loaded = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.reader, text="Ок")
+        loaded.text = "Правка"
+        loaded.save()
+        client.post(
+            reverse("posts:post_edit", args=(post.pk,)), {"text": "Еще"}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Еще")
+        self.assertEqual(post.comments_count, 1)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет рассинхронизацию счетчиков."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пост {i}") for i in range(3)
+        )
+        UserCounters.objects.filter(user=self.reader).delete()
+        call_command("recount", "--batch-size", "1", stdout=StringIO())
+        self.assertEqual(self.counters(self.author).posts_count, 3)
+        self.assertEqual(self.counters(self.reader).posts_count, 0)
+        response = Client().get(
+            reverse("posts:profile", args=(self.author.username,))
+        )
+        self.assertContains(response, "Всего постов: 3")
+
+
+# Тесты идут с THUMBNAIL_WORKERS = 0; здесь пул включен, но schedule()
+# подменяется, и процессы не запускаются.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="painter")
+        cls.post = Post.objects.create(
+            author=cls.user, text="Картинка",
+            image=SimpleUploadedFile(
+                name="thumb.gif", content=TaskPagesTests.small_gif,
+                content_type="image/gif"
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("posts:profile", args=(self.user.username,))
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Пока миниатюры нет, выводится заглушка и ставится задача."""
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            response = Client().get(self.url)
+        self.assertContains(response, "data:image/svg+xml")
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args[0][0], self.post.image.name)
+
+    def test_thumbnail_shown_after_generation(self):
+        """После фоновой генерации выводится готовая миниатюра."""
+        thumbnails.generate(self.post.image.name)
+        detail = reverse("posts:post_detail", args=(self.post.pk,))
+        for url in (self.url, detail):
+            with mock.patch.object(thumbnails, "schedule") as schedule:
+                response = Client().get(url)
+            schedule.assert_not_called()
+            self.assertNotContains(response, "data:image/svg+xml")
+            self.assertContains(response, "/media/cache/")
+
+    def test_cached_pages_drop_placeholder(self):
+        """Готовая миниатюра сбрасывает страницы с заглушкой."""
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            self.assertContains(client.get(self.url), "data:image/svg+xml")
+            self.assertContains(client.get(self.url), "data:image/svg+xml")
+        name, geometries, scopes = schedule.call_args[0]
+        thumbnails.generate(name, geometries)
+        key = (name, repr(geometries))
+        thumbnails._pending[key] = set(scopes)
+        future = Future()
+        future.set_result(name)
+        with self.assertNumQueries(0):
+            thumbnails._done(key, name, geometries)(future)
+        self.assertNotIn(key, thumbnails._pending)
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            response = client.get(self.url)
+        schedule.assert_not_called()
+        self.assertNotContains(response, "data:image/svg+xml")
+
+    def test_form_schedules_pregeneration(self):
+        """Сохранение картинки через PostForm ставит миниатюры в очередь."""
+        client = Client()
+        client.force_login(self.user)
+        image = SimpleUploadedFile(
+            name="new.gif", content=TaskPagesTests.small_gif,
+            content_type="image/gif"
+        )
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            client.post(
+                reverse("posts:post_create"),
+                data={"text": "С картинкой", "image": image},
+            )
+        post = Post.objects.latest("id")
+        schedule.assert_called_once_with(
+            post.image.name, scopes=feed_scopes(post)
+        )
+
+    def test_page_thumbnails_resolved_in_one_query(self):
+        """Миниатюры страницы читаются из хранилища одним запросом."""
+        posts = [self.post] + [
+            Post.objects.create(
+                author=self.user, text=f"Картинка {i}",
+                image=SimpleUploadedFile(
+                    name=f"thumb{i}.gif", content=TaskPagesTests.small_gif,
+                    content_type="image/gif"
+                )
+            ) for i in range(3)
+        ]
+        for post in posts:
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.resolve_page(
+                posts, "960x339", crop="center", upscale=True
+            )
+        for post in posts:
+            with self.subTest(post=post):
+                self.assertIn("/media/cache/", post.thumbnail.url)
+        with self.assertNumQueries(0):
+            thumbnails.resolve_page(
+                posts, "960x339", crop="center", upscale=True
+            )
+
+    def test_backfill_command(self):
+        """Команда pregenerate_thumbnails создает миниатюры постов."""
+        call_command("pregenerate_thumbnails", "--workers", "0",
+                     stdout=StringIO())
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            Client().get(self.url)
+        schedule.assert_not_called()
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="etag")
+        cls.group = Group.objects.create(
+            title="Группа", slug="etag-slug", description="Описание"
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text="Пост", group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse("posts:index"),
+            reverse("posts:group_list", args=(self.group.slug,)),
+            reverse("posts:profile", args=(self.user.username,)),
+            reverse("posts:post_detail", args=(self.post.id,)),
+        )
+
+    def test_unchanged_page_returns_304(self):
+        """Повторный запрос с ETag получает 304 без рендеринга."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+
+    def test_write_changes_etag(self):
+        """После комментария и правки поста страницы отдаются заново."""
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.user, text="Ок")
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+        self.assertEqual(response.status_code, 200)
+        self.post.text = "Новый текст"
+        self.post.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_csrf_rotation_changes_etag(self):
+        """Новый CSRF-токен отдает страницу с формой заново."""
+        self.client.force_login(self.user)
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+        self.client.cookies["csrftoken"] = "a" * 64
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "csrfmiddlewaretoken")
+
+    def test_follow_changes_follower_etag(self):
+        """Подписка и отписка меняют ETag профиля подписчика."""
+        follower = User.objects.create_user(username="follower")
+        url = reverse("posts:profile", args=(follower.username,))
+        etag = self.client.get(url)["ETag"]
+        follow = Follow.objects.create(user=follower, author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "подписок: 1")
+        etag = response["ETag"]
+        follow.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "подписок: 0")
+
+    def test_admin_edit_updates_last_modified(self):
+        """Правка поста в админке сдвигает updated и Last-Modified."""
+        post = Post.objects.create(author=self.user, text="Старый")
+        url = reverse("posts:post_detail", args=(post.id,))
+        Post.objects.filter(pk=post.pk).update(
+            updated=post.updated - timedelta(days=1)
+        )
+        last_modified = self.client.get(url)["Last-Modified"]
+        admin = User.objects.create_superuser("root", "r@r.ru", "pass")
+        self.client.force_login(admin)
+        self.client.post(
+            reverse("admin:posts_post_change", args=(post.pk,)),
+            {"text": "Новый", "author": self.user.pk, "group": ""},
+        )
+        self.client.logout()
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Новый")
+        self.assertGreater(post.updated, timezone.now() - timedelta(hours=1))
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_for_post_detail(self):
+        """post_detail отдает Last-Modified по посту и комментариям."""
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Группа", slug="page-slug", description="Описание"
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text="Пост", group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.index = reverse("posts:index")
+
+    def test_anonymous_page_served_without_queries(self):
+        """Повторная страница для анонима отдается без запросов к БД."""
+        for url in (
+            self.index,
+            reverse("posts:group_list", args=(self.group.slug,)),
+            reverse("posts:profile", args=(self.user.username,)),
+            reverse("posts:post_detail", args=(self.post.id,)),
+        ):
+            with self.subTest(url=url):
+                content = self.client.get(url).content
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.content, content)
+                self.assertFalse(response.templates)
+
+    def test_shared_body_gets_personal_header(self):
+        """Вошедший получает общее тело со своей шапкой и переключателем."""
+        self.client.get(self.index)
+        response = self.authorized_client.get(self.index)
+        self.assertNotIn("posts/index.html",
+                         [t.name for t in response.templates])
+        self.assertContains(response, "Пользователь: reader")
+        self.assertContains(response, "Избранные авторы")
+        response = self.client.get(self.index)
+        self.assertNotContains(response, "Пользователь: reader")
+        self.assertNotContains(response, "Избранные авторы")
+        self.assertContains(response, "Регистрация")
+
+    def test_personal_views_not_shared(self):
+        """Профиль и пост для вошедшего рендерятся заново."""
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        self.client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertIn("posts/post_detail.html",
+                      [t.name for t in response.templates])
+        self.assertContains(response, "редактировать")
+
+    def test_writes_purge_pages(self):
+        """Новые посты и комментарии сразу видны в кешированных страницах."""
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        self.client.get(self.index)
+        self.client.get(url)
+        Post.objects.create(author=self.user, text="Свежий пост")
+        Comment.objects.create(post=self.post, author=self.user,
+                               text="Свежий комментарий")
+        self.assertContains(self.client.get(self.index), "Свежий пост")
+        self.assertContains(self.client.get(url), "Свежий комментарий")
+
+    def test_cached_page_answers_conditional_get(self):
+        """Страница из кеша отвечает 304 на совпавший ETag."""
+        etag = self.client.get(self.index)["ETag"]
+        response = self.client.get(self.index, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
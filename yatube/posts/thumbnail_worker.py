@@ -0,0 +1,35 @@
+"""Задачи процессов пула миниатюр.
+
+Процессы запускаются через spawn, а не fork: родитель - многопоточный
+сервер. Дочерний процесс импортирует этот модуль до django.setup(),
+поэтому модели здесь не импортируются.
+"""
+import logging
+import multiprocessing
+
+from django.conf import settings
+from sorl.thumbnail.base import ThumbnailBackend
+
+logger = logging.getLogger(__name__)
+
+MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def generate(name, geometries=None):
+    """Синхронно создает миниатюры файла; выполняется в процессе пула."""
+    backend = ThumbnailBackend()
+    for geometry, options in geometries or settings.THUMBNAIL_GEOMETRIES:
+        try:
+            backend.get_thumbnail(name, geometry, **options)
+        except Exception:
+            logger.info('Не удалось создать миниатюру %s %s', name, geometry,
+                        exc_info=True)
+    return name
@@ -0,0 +1,219 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from core.cache import PAGE_SCOPE, bump_generation
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import (DummyImageFile, ImageFile,
+                                   deserialize_image_file)
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+
+from .models import Post
+from .signals import feed_scopes
+from .thumbnail_worker import MP_CONTEXT, generate, init_worker
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{x}" height="{y}">'
+    '<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Ожидающие задачи -> области кеша, в которые попала заглушка.
+_pending = {}
+
+
+class PlaceholderImageFile(DummyImageFile):
+    """Заглушка, пока миниатюра готовится в фоне."""
+
+    @property
+    def url(self):
+        svg = PLACEHOLDER_SVG.format(x=self.x, y=self.y)
+        return 'data:image/svg+xml,' + quote(svg)
+
+
+class PregeneratingThumbnailBackend(ThumbnailBackend):
+    """Отдает готовые миниатюры, а недостающие ставит в фоновую очередь.
+
+    Запрос никогда не ресайзит картинку сам: при промахе в хранилище
+    ключей sorl возвращается PlaceholderImageFile.
+    """
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        if not settings.THUMBNAIL_WORKERS:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        name = getattr(file_, 'name', file_)
+        thumbnail = self.thumbnail_file(file_, geometry_string, dict(options))
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        schedule(name, [(geometry_string, options)])
+        return PlaceholderImageFile(geometry_string)
+
+    def get_many(self, files, geometry_string, scopes=None, **options):
+        """Миниатюры для набора файлов за один запрос к хранилищу ключей.
+
+        scopes - словарь имя файла -> области кеша страниц, которые
+        покажут заглушку; их сбросит готовая миниатюра. Возвращает
+        словарь имя файла -> ImageFile (или заглушка).
+        """
+        scopes = scopes or {}
+        targets = {}
+        for file_ in files:
+            name = getattr(file_, 'name', file_)
+            if name and name not in targets:
+                targets[name] = self.thumbnail_file(
+                    name, geometry_string, dict(options)
+                )
+        raw = get_many_raw([add_prefix(t.key) for t in targets.values()])
+        result = {}
+        for name, thumbnail in targets.items():
+            value = raw.get(add_prefix(thumbnail.key))
+            if value:
+                result[name] = deserialize_image_file(value)
+            elif settings.THUMBNAIL_WORKERS:
+                schedule(name, [(geometry_string, options)],
+                         scopes.get(name, ()))
+                result[name] = PlaceholderImageFile(geometry_string)
+            else:
+                result[name] = super().get_thumbnail(
+                    name, geometry_string, **options
+                )
+        return result
+
+
+def get_many_raw(keys):
+    """Пакетный аналог KVStore._get_raw: get_many в кеше, затем один
+    запрос к таблице sorl для промахов."""
+    kvstore = default.kvstore
+    if not keys:
+        return {}
+    if not hasattr(kvstore, 'cache'):
+        return {key: kvstore._get_raw(key) for key in keys}
+    from sorl.thumbnail.models import KVStore as KVStoreModel
+
+    found = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        loaded = {key: rows.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(loaded)
+    return {
+        key: value for key, value in found.items()
+        if value is not EMPTY_VALUE
+    }
+
+
+def resolve_page(posts, geometry_string, **options):
+    """Проставляет post.thumbnail всем постам страницы одним запросом.
+
+    posts - страница, список постов или один пост.
+    """
+    posts = [posts] if isinstance(posts, Post) else list(posts)
+    backend = default.backend
+    if not hasattr(backend, 'get_many'):
+        backend = PregeneratingThumbnailBackend()
+    scopes = {}
+    for post in posts:
+        if post.image:
+            scopes.setdefault(post.image.name, set()).update(
+                feed_scopes(post)
+            )
+    resolved = backend.get_many(
+        list(scopes), geometry_string, scopes=scopes, **options
+    )
+    for post in posts:
+        post.thumbnail = resolved.get(post.image.name) if post.image else None
+    return posts
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=MP_CONTEXT, initializer=init_worker,
+            )
+        return _executor
+
+
+def thumbnails_ready(name, scopes=(), geometries=None):
+    """Миниатюры файла созданы: сбрасывает то, что запомнило заглушку.
+
+    Это промахи хранилища ключей sorl в кеше (процессы пула пишут мимо
+    локального кеша родителя) и кешированные страницы, фрагменты и ETag
+    из scopes. Базу не читает: посты с картинкой знает тот, кто ставил
+    задачу.
+    """
+    kvstore = default.kvstore
+    if hasattr(kvstore, 'cache'):
+        backend = default.backend
+        if not hasattr(backend, 'thumbnail_file'):
+            backend = PregeneratingThumbnailBackend()
+        kvstore.cache.delete_many([
+            add_prefix(backend.thumbnail_file(name, geometry, dict(opts)).key)
+            for geometry, opts in geometries or settings.THUMBNAIL_GEOMETRIES
+        ])
+    bump_generation(PAGE_SCOPE, *scopes)
+
+
+def _done(key, name, geometries):
+    def callback(future):
+        with _executor_lock:
+            scopes = _pending.pop(key, ())
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            thumbnails_ready(name, scopes, geometries)
+        except Exception:
+            logger.exception('Не удалось сбросить кеш миниатюр %s', name)
+    return callback
+
+
+def schedule(name, geometries=None, scopes=()):
+    """Ставит генерацию миниатюр в пул, не дублируя уже ожидающие.
+
+    scopes - области кеша, которые сбросить, когда миниатюры будут готовы.
+    """
+    if not name:
+        return None
+    geometries = geometries or settings.THUMBNAIL_GEOMETRIES
+    if not settings.THUMBNAIL_WORKERS:
+        return generate(name, geometries)
+    key = (name, repr(geometries))
+    with _executor_lock:
+        pending = key in _pending
+        _pending.setdefault(key, set()).update(scopes)
+        if pending:
+            return None
+    future = get_executor().submit(generate, name, geometries)
+    future.add_done_callback(_done(key, name, geometries))
+    return future
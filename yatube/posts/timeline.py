@@ -0,0 +1,124 @@
+from core import sharding
+from core.cache import bump_generation
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Follow, Post, TimelineEntry
+
+
+def scope(user_id):
+    """Область инвалидации кеша ленты подписок пользователя."""
+    return f"timeline:{user_id}"
+
+
+def enabled():
+    """Материализованная лента есть, только пока посты в одной базе.
+
+    На шардах follow_index собирает ленту из шардов авторов, а записи
+    TimelineEntry ссылались бы на посты из другой базы.
+    """
+    return not sharding.is_sharded(Post)
+
+
+def _entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id, post=post,
+        author_id=post.author_id, pub_date=post.pub_date
+    )
+
+
+def _follower_ids(author_id):
+    return list(
+        Follow.objects.filter(author_id=author_id)
+        .values_list("user_id", flat=True).distinct()
+    )
+
+
+def invalidate_followers(author_id):
+    """Сбрасывает кеш лент подписчиков после правки поста автора."""
+    bump_generation(*(scope(user_id) for user_id in _follower_ids(author_id)))
+
+
+TRIM_CHUNK = 500
+
+
+def trim(*user_ids):
+    """Оставляет в лентах не больше TIMELINE_MAX_LENGTH свежих записей.
+
+    Один DELETE на пачку пользователей. Окно считает для каждой записи
+    число записей не старше нее; прямой порядок окна совпадает с индексом
+    (user, pub_date, post), и сортировка не нужна.
+    """
+    meta = TimelineEntry._meta
+    connection = connections[router.db_for_write(TimelineEntry)]
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    user, pub_date, post = (
+        quote(meta.get_field(name).column)
+        for name in ("user", "pub_date", "post")
+    )
+    for start in range(0, len(user_ids), TRIM_CHUNK):
+        chunk = user_ids[start:start + TRIM_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {quote(meta.pk.column)} IN ("
+                f"SELECT id FROM (SELECT {quote(meta.pk.column)} AS id,"
+                f" COUNT(*) OVER (PARTITION BY {user}"
+                f" ORDER BY {pub_date}, {post} ROWS BETWEEN CURRENT ROW"
+                f" AND UNBOUNDED FOLLOWING) AS newer"
+                f" FROM {table} WHERE {user} IN ({placeholders}))"
+                f" WHERE newer > %s)",
+                [*chunk, settings.TIMELINE_MAX_LENGTH],
+            )
+
+
+def fan_out(post):
+    """Разносит новый пост в ленты всех подписчиков автора."""
+    followers = _follower_ids(post.author_id)
+    if enabled():
+        TimelineEntry.objects.bulk_create(
+            [_entry(user_id, post) for user_id in followers],
+            ignore_conflicts=True,
+        )
+        trim(*followers)
+    bump_generation(*(scope(user_id) for user_id in followers))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if not enabled():
+        bump_generation(scope(user_id))
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        "id", "author_id", "pub_date"
+    )[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+    bump_generation(scope(user_id))
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    bump_generation(scope(user_id))
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля по его подпискам."""
+    if not enabled():
+        return
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).only("id", "author_id", "pub_date").order_by(
+        "-pub_date", "-id"
+    ).distinct()[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+    bump_generation(scope(user_id))
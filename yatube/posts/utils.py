@@ -1,8 +1,153 @@
+import base64
+from collections.abc import Sequence
+
 from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(post):
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None, если токен битый."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Sequence):
+    is_cursor = True
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        if not self.object_list:
+            return '<Cursor page (empty)>'
+        return (f'<Cursor page {self.object_list[0].pk}'
+                f'..{self.object_list[-1].pk}>')
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        limit = self.per_page + 1
+        if before is not None:
+            pub_date, pk = before
+            rows = list(
+                self.queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                ).order_by('pub_date', 'id')[:limit]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+        queryset = self.queryset.order_by('-pub_date', '-id')
+        if after is not None:
+            pub_date, pk = after
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        rows = list(queryset[:limit])
+        has_next = len(rows) > self.per_page
+        return CursorPage(
+            rows[:self.per_page], self, has_next, after is not None
+        )
+
+
+PAGE_ELLIPSIS = '…'
+
+
+def get_page_window(page, on_each_side=2, on_ends=1):
+    """Номера страниц вокруг текущей плюс края, пропуски - PAGE_ELLIPSIS.
+
+    Длина списка не зависит от общего числа страниц.
+    """
+    num_pages = page.paginator.num_pages
+    number = page.number
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > on_each_side + on_ends + 1:
+        window.extend(range(1, on_ends + 1))
+        window.append(PAGE_ELLIPSIS)
+        window.extend(range(number - on_each_side, number + 1))
+    else:
+        window.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends:
+        window.extend(range(number + 1, number + on_each_side + 1))
+        window.append(PAGE_ELLIPSIS)
+        window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        window.extend(range(number + 1, num_pages + 1))
+    return window
+
+
+def use_cursor_pagination(request):
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else None
+    return view_name in settings.CURSOR_PAGINATION_VIEWS
 
 
-def get_page_paginator(request, queryset):
+def get_page_paginator(request, queryset, cursor=None):
+    if cursor is None:
+        cursor = use_cursor_pagination(request)
+    if cursor:
+        paginator = CursorPaginator(queryset, settings.NUMBER_POSTS)
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
     paginator = Paginator(queryset, settings.NUMBER_POSTS)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
@@ -1,23 +1,30 @@
+from core.sharding import related
 from django.contrib.auth.decorators import login_required
 # from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
+from posts import conditional, timeline
+from posts.search import search_posts
 from posts.utils import get_page_paginator
 
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .models import Follow, Group, Post, User
 
 
+@condition(etag_func=conditional.index_etag,
+           last_modified_func=conditional.index_last_modified)
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.feed().across_shards()
     context = {
         'page_obj': get_page_paginator(request, post_list)
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=conditional.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = Post.objects.for_group(group)
     context = {
         'group': group,
         'page_obj': get_page_paginator(request, post_list)
@@ -25,9 +32,12 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=conditional.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
+    author_posts = Post.objects.for_author(author)
     context = {
         'author': author,
         'page_obj': get_page_paginator(request, author_posts),
@@ -38,10 +48,25 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query) if query else Post.objects.none()
+    context = {
+        'query': query,
+        'page_obj': get_page_paginator(request, posts, cursor=False),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@condition(etag_func=conditional.post_detail_etag,
+           last_modified_func=conditional.post_detail_last_modified)
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(
+        related(Post.objects.located(post_id), 'author__counters', 'group'),
+        pk=post_id
+    )
+    comments = related(post.comments.all(), 'author')
     context = {
         'post': post,
         'form': form,
@@ -60,13 +85,14 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        form.pregenerate_thumbnails()
         return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.located(post_id), pk=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id=post.id)
 
@@ -77,6 +103,7 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        form.pregenerate_thumbnails()
         return redirect('posts:post_detail', post_id=post.id)
 
     context = {
@@ -89,7 +116,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.located(post_id), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -101,9 +128,10 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
+    posts = Post.objects.for_follower(request.user)
     context = {
         "page_obj": get_page_paginator(request, posts),
+        "timeline_scope": timeline.scope(request.user.pk),
     }
     return render(request, "posts/follow.html", context)
 
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -32,12 +33,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.PageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -45,7 +51,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.MeteredDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -67,8 +73,73 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живет между запросами потока; перед запросом его
+        # проверяет core.db.check_connections (DB_HEALTH_CHECKS).
+        'CONN_MAX_AGE': 60,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+# Шарды постов: те же таблицы, но пользователи и группы остаются в
+# default, поэтому внешние ключи на шардах не проверяются (PRAGMAS
+# дополняют SQLITE_PRAGMAS для одного алиаса).
+for shard in ('shard1', 'shard2', 'shard3'):
+    DATABASES[shard] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db-{shard}.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'PRAGMAS': {'foreign_keys': 'OFF'},
     }
+
+# Чтения моделей REPLICATED_MODELS идут на реплики DATABASE_REPLICAS
+# (core.routers.ReplicaRouter). Пусто - все в default. Локально:
+#   export DATABASE_REPLICAS=replica
+#   python manage.py sync_replicas --interval 2 & python manage.py runserver
+DATABASE_ROUTERS = ['core.sharding.ShardRouter', 'core.routers.ReplicaRouter']
+DATABASE_REPLICAS = [
+    alias for alias in os.environ.get('DATABASE_REPLICAS', '').split(',')
+    if alias
+]
+REPLICATED_MODELS = ('posts.Post', 'posts.Group', 'posts.Comment',
+                     'posts.Follow')
+# Сколько секунд после записи клиент читает из default; остальные клиенты
+# на это время наполняют кеш под поколениями тоже из default.
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+# Посты и комментарии автора лежат на шарде crc32(author_id) из SHARDS
+# (core.sharding). Пусто - все в default. После изменения списка шардов
+# данные переносит manage.py reshard. Пример:
+#   export SHARDS=default,shard1,shard2
+#   python manage.py migrate --database shard1 (и shard2)
+#   python manage.py reshard
+SHARDS = [
+    alias for alias in os.environ.get('SHARDS', '').split(',') if alias
+]
+SHARDED_MODELS = {
+    'posts.Post': 'author_id',
+    'posts.Comment': 'post.author_id',
+    'posts.SearchToken': 'post.author_id',
+}
+# Потоки для параллельных запросов к шардам; 0 - по очереди.
+SHARD_WORKERS = 8
+
+# Прагмы каждого нового соединения SQLite (core.db.configure_sqlite).
+# WAL: читатели не ждут пишущих; NORMAL в WAL не теряет целостность
+# при сбое процесса. cache_size в КиБ со знаком минус, mmap_size в байтах.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
+DB_HEALTH_CHECKS = True
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -101,6 +172,14 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# Сессия и пользователь сессии читаются из кеша: без них каждый запрос
+# вошедшего пользователя начинался с двух запросов к БД. Сессии пишутся
+# и в кеш, и в БД; пользователя из кеша сбрасывает core.auth при save().
+# Сессии, открытые через ModelBackend, переводит миграция core 0001.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['core.auth.CachedModelBackend']
+USER_CACHE_TIMEOUT = 300
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -109,14 +188,109 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUMBER_POSTS = 10
 
+# Имена представлений ('posts:index', ...), которые листаются по курсору
+# ?after=/?before= вместо номеров страниц.
+CURSOR_PAGINATION_VIEWS = ()
+
+# Сколько последних постов хранится в материализованной ленте подписок.
+TIMELINE_MAX_LENGTH = 1000
+
+# Поиск по постам: 'fts5' (SQLite FTS5), 'inverted' (таблица SearchToken)
+# или 'auto' - FTS5, если он собран в SQLite.
+POST_SEARCH_BACKEND = 'auto'
+
+# Страницы, которые PageCacheMiddleware кеширует целиком для анонимов, и
+# те из них, чье общее тело можно отдавать вошедшим пользователям.
+PAGE_CACHE_VIEWS = (
+    'posts:index', 'posts:group_list', 'posts:profile', 'posts:post_detail',
+)
+PAGE_CACHE_SHARED_VIEWS = ('posts:index', 'posts:group_list')
+PAGE_CACHE_TIMEOUT = 300
+
+# Метрики /metrics: каждый процесс раз в METRICS_FLUSH_INTERVAL секунд
+# пишет свою сводку в METRICS_DIR. Каталог стоит очищать при деплое.
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Запросы к БД дольше SLOW_QUERY_THRESHOLD секунд пишутся в лог и в
+# кольцевой буфер из SLOW_QUERY_LOG_SIZE записей (admin/slow-queries/).
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_LOG_SIZE = 100
+
+# Детектор N+1: форма запроса, повторенная NPLUSONE_THRESHOLD раз за
+# запрос, пишется в лог (или вызывает NPlusOneError при NPLUSONE_RAISE).
+NPLUSONE_ENABLED = False
+NPLUSONE_SAMPLE_RATE = 1.0
+NPLUSONE_THRESHOLD = 5
+NPLUSONE_RAISE = False
+
+# Профилирование по запросу персонала: ?_profile=1 (или X-Profile: 1)
+# сохраняет профиль в PROFILING_DIR, ?_profile=show отдает отчет сразу.
+# PROFILING_RELEASE попадает в имя файла, чтобы сравнивать деплои.
+PROFILING_PARAM = '_profile'
+PROFILING_DIR = os.environ.get(
+    'PROFILING_DIR', os.path.join(BASE_DIR, 'profiles')
+)
+PROFILING_TOP = 60
+PROFILING_RELEASE = os.environ.get('RELEASE', 'dev')
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CSRF_FAILURE_VIEW = "core.views.csrf_failure"
 
+# Миниатюры создаются в фоновом пуле процессов, а до готовности
+# шаблоны показывают заглушку. 0 - создавать синхронно, как sorl по умолчанию.
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratingThumbnailBackend'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_GEOMETRIES = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+    ('960x900', {'crop': 'center', 'upscale': True}),
+]
+
+# Блокировка пересчета промаха в get_or_build(): сколько она живет и
+# сколько ждут остальные запросы, если устаревшей копии нет (секунды).
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 2
+# Потоки фонового обновления для get_or_revalidate(); 0 - обновлять сразу.
+CACHE_REVALIDATE_WORKERS = 4
+
+# L1 в памяти процесса перед общим для всех процессов кешем в файле
+# SQLite с вытеснением по LRU. Узлы узнают об изменениях из канала
+# инвалидации в том же файле. Файл создается с правами 0600 в каталоге
+# приложения (var/ не в git): в общем /tmp его мог бы подменить любой
+# пользователь машины. Тесты берут свой файл (core.test_runner).
+CACHE_FILE = os.environ.get(
+    'CACHE_FILE', os.path.join(BASE_DIR, 'var', 'cache.sqlite3')
+)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'CHANNEL': CACHE_FILE,
+            'MAX_ENTRIES': 1000,
+            'POLL_INTERVAL': 0.5,
+            'LOCAL_TIMEOUT': 30,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': CACHE_FILE,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,
+        },
     }
 }
+
+TEST_RUNNER = 'core.test_runner.TestRunner'
+# Подменяются на время тестов (core.test_runner): миниатюры создаются
+# сразу, без пула процессов.
+TEST_OVERRIDES = {
+    'THUMBNAIL_WORKERS': 0,
+}
@@ -1,3 +1,4 @@
+from core.views import metrics, profile_download, profiles, slow_queries
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
@@ -5,10 +6,26 @@ from django.urls import include, path
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
+    path(
+        'admin/slow-queries/',
+        admin.site.admin_view(slow_queries),
+        name='slow_queries'
+    ),
+    path(
+        'admin/profiles/',
+        admin.site.admin_view(profiles),
+        name='profiles'
+    ),
+    path(
+        'admin/profiles/<str:name>',
+        admin.site.admin_view(profile_download),
+        name='profile_download'
+    ),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics', metrics, name='metrics'),
 ]
 handler403 = 'core.views.permission_denied'
 handler404 = 'core.views.page_not_found'